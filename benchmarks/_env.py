@@ -0,0 +1,19 @@
+"""
+Benchmark environment - imported first by every benchmark script
+
+Puts the repository root on sys.path and points DATABASE_URL at
+BENCH_DATABASE_URL before database.session reads it. The benchmarks
+truncate shipments and shipment_events, so there is no default: without
+BENCH_DATABASE_URL the script exits instead of guessing a database.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("BENCH_DATABASE_URL"):
+    sys.exit(
+        "BENCH_DATABASE_URL is not set. Point it at a scratch database - the benchmarks "
+        "truncate shipments and shipment_events there."
+    )
+os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
@@ -0,0 +1,158 @@
+"""
+Benchmark: 100-row customer response, ORM hydration + dict building vs
+projected row tuples + FieldSpec + orjson
+
+Runs against the scratch database in BENCH_DATABASE_URL (required):
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://postgres@localhost/bench \\
+        python -m benchmarks.serialization --iterations 500
+
+Reports the full path (query + build + encode) and the build + encode part
+alone, on the same 100 rows of the customer with the most shipments.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import benchmarks._env  # noqa: F401 - before any app module reads DATABASE_URL
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from database.session import AsyncSessionLocal, engine
+from models.shipment import Shipment
+from services.serialization import CUSTOMER_SHIPMENT_SPEC, ORJSONResponse
+
+ROWS = 100
+
+
+def legacy_body(customer_id: str, shipments) -> bytes:
+    """The pre-FieldSpec endpoint body, rendered the way FastAPI renders a returned dict"""
+    content = {
+        "customer_id": customer_id,
+        "total_shipments": len(shipments),
+        "shipments": [
+            {
+                "track_no": s.track_no,
+                "invoice_number": s.invoice_number,
+                "status_code": s.status_code,
+                "status_desc": s.status_desc,
+                "exception_code": s.exception_code,
+                "exception_desc": s.exception_desc,
+                "estimated_delivery": s.estimated_delivery,
+                "delivered_time": s.delivered_time,
+                "received_by": s.received_by,
+                "current_location": s.current_location,
+                "last_scan_location": s.last_scan_location,
+                "delivery_attempt_count": s.delivery_attempt_count,
+                "created_at": s.created_at.isoformat() if s.created_at else None,
+                "updated_at": s.updated_at.isoformat() if s.updated_at else None
+            }
+            for s in shipments
+        ],
+    }
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def projected_body(customer_id: str, rows) -> bytes:
+    return ORJSONResponse({
+        "customer_id": customer_id,
+        "total_shipments": len(rows),
+        "shipments": CUSTOMER_SHIPMENT_SPEC.rows(rows),
+    }).body
+
+
+def legacy_query(customer_id: str):
+    return (
+        select(Shipment)
+        .where(Shipment.customer_id == customer_id)
+        .order_by(Shipment.updated_at.desc().nulls_last(), Shipment.id.desc())
+        .limit(ROWS)
+    )
+
+
+def projected_query(customer_id: str):
+    return (
+        select(*CUSTOMER_SHIPMENT_SPEC.query_columns(Shipment.id))
+        .where(Shipment.customer_id == customer_id)
+        .order_by(Shipment.updated_at.desc().nulls_last(), Shipment.id.desc())
+        .limit(ROWS)
+    )
+
+
+def summarize(name: str, timings_ms) -> dict:
+    timings_ms = sorted(timings_ms)
+    return {
+        "path": name,
+        "mean_ms": round(statistics.mean(timings_ms), 3),
+        "p50_ms": round(timings_ms[len(timings_ms) // 2], 3),
+        "p95_ms": round(timings_ms[int(len(timings_ms) * 0.95)], 3),
+    }
+
+
+async def end_to_end(name: str, iterations: int, customer_id: str, run) -> dict:
+    timings = []
+    for _ in range(iterations):
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await run(db)
+            timings.append((time.perf_counter() - started) * 1000)
+    return summarize(name, timings)
+
+
+def encode_only(name: str, iterations: int, build) -> dict:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        build()
+        timings.append((time.perf_counter() - started) * 1000)
+    return summarize(name, timings)
+
+
+async def main(iterations: int):
+    engine.echo = False
+    async with AsyncSessionLocal() as db:
+        customer_id = (await db.execute(
+            select(Shipment.customer_id)
+            .group_by(Shipment.customer_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        )).scalar()
+        if customer_id is None:
+            print("shipments is empty - seed it first: python bulk_load.py generate --rows 100000 --load")
+            return
+        shipments = (await db.execute(legacy_query(customer_id))).scalars().all()
+        rows = (await db.execute(projected_query(customer_id))).all()
+    print(f"customer {customer_id}: {len(rows)} rows per response\n")
+
+    async def legacy(db):
+        result = await db.execute(legacy_query(customer_id))
+        legacy_body(customer_id, result.scalars().all())
+
+    async def projected(db):
+        result = await db.execute(projected_query(customer_id))
+        projected_body(customer_id, result.all())
+
+    results = [
+        await end_to_end("orm + dicts + json (query, build, encode)", iterations, customer_id, legacy),
+        await end_to_end("projected + FieldSpec + orjson (query, build, encode)", iterations, customer_id, projected),
+        encode_only("orm + dicts + json (build, encode)", iterations, lambda: legacy_body(customer_id, shipments)),
+        encode_only("FieldSpec + orjson (build, encode)", iterations, lambda: projected_body(customer_id, rows)),
+    ]
+    for result in results:
+        print(result)
+    print(
+        f"\nfull path p50: {results[0]['p50_ms']}ms -> {results[1]['p50_ms']}ms, "
+        f"build+encode p50: {results[2]['p50_ms']}ms -> {results[3]['p50_ms']}ms"
+    )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
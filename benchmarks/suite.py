@@ -0,0 +1,319 @@
+"""
+Benchmark suite: ingest and read paths under concurrent load
+
+Runs against the scratch database in BENCH_DATABASE_URL (required). Seeds a
+fixed, seeded dataset with bulk_load.py, drives the app with concurrent
+async clients and reports throughput and p50/p95/p99 latency per endpoint:
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://postgres@localhost/bench \\
+        python -m benchmarks.suite --size 1m --concurrency 32
+
+By default the app runs in-process through httpx's ASGI transport; pass
+--base-url to hit a running server instead (started against the same
+database). Every run is saved to benchmarks/results/ as JSON, and
+--compare flags endpoints whose p95 or throughput regressed against an
+earlier run (exit code 1 on regression).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import benchmarks._env  # noqa: F401 - before any app module reads DATABASE_URL
+
+import asyncpg
+import httpx
+
+import bulk_load
+from database.migrations import migrate
+from database.session import DATABASE_URL, asyncpg_dsn, engine
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+DATA_SEED = 42
+CUSTOMERS = 5_000
+SAMPLE_ROWS = 2_000
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BENCH_TRACK_PREFIX = "1ZBENCHW"
+# ה-webhooks מעדכנים רק משלוחים ייעודיים לבנצ'מרק - ה-dataset עצמו לא משתנה בין ריצות
+BENCH_UPDATE_ROWS = 2_000
+
+# (method, path, json body)
+Request = tuple
+
+
+def update_track_no(n: int) -> str:
+    return f"{BENCH_TRACK_PREFIX}U{n:09d}"
+
+
+async def reset_benchmark_rows(conn):
+    """
+    Removes everything the webhook scenario wrote: its shipments and all
+    shipment_events (the seeded dataset is loaded without history)
+    """
+    await conn.execute(f"DELETE FROM shipments WHERE track_no LIKE '{BENCH_TRACK_PREFIX}%'")
+    await conn.execute("TRUNCATE shipment_events")
+
+
+async def seed(size: int, reseed: bool):
+    """
+    Loads the seeded dataset unless the table already holds exactly `size`
+    rows, then (re)creates the shipments the webhook scenario updates
+    """
+    conn = await asyncpg.connect(asyncpg_dsn(DATABASE_URL))
+    try:
+        await reset_benchmark_rows(conn)
+        await _seed_dataset(conn, size, reseed)
+        payloads = (
+            {"trackNo": update_track_no(n), "ref1": f"CUST{n % CUSTOMERS + 1:06d}", "statusCode": 5}
+            for n in range(BENCH_UPDATE_ROWS)
+        )
+        await bulk_load.load_rows(conn, bulk_load.payload_rows(payloads), with_events=False)
+    finally:
+        await conn.close()
+
+
+async def _seed_dataset(conn, size: int, reseed: bool):
+    current = await conn.fetchval(
+        f"SELECT count(*) FROM shipments WHERE track_no NOT LIKE '{BENCH_TRACK_PREFIX}%'"
+    )
+    if current == size and not reseed:
+        print(f"📦 dataset already seeded ({current:,} rows)")
+        return
+    print(f"📦 seeding {size:,} rows (seed={DATA_SEED})")
+    await conn.execute("TRUNCATE shipments, shipment_events")
+    payloads = bulk_load.generate_payloads(size, CUSTOMERS, 90, DATA_SEED)
+    await bulk_load.load_rows(conn, bulk_load.payload_rows(payloads), with_events=False)
+    await conn.execute("ANALYZE shipments")
+
+
+async def sample_keys() -> Dict[str, List[str]]:
+    conn = await asyncpg.connect(asyncpg_dsn(DATABASE_URL))
+    try:
+        estimate = await conn.fetchval(
+            "SELECT greatest(reltuples, 1) FROM pg_class WHERE relname = 'shipments'"
+        )
+        percent = min(100.0, SAMPLE_ROWS * 100.0 / max(estimate, 1))
+        rows = await conn.fetch(
+            f"SELECT track_no, customer_id FROM shipments TABLESAMPLE SYSTEM ({percent}) "
+            f"REPEATABLE ({DATA_SEED}) WHERE track_no NOT LIKE '{BENCH_TRACK_PREFIX}%' LIMIT {SAMPLE_ROWS}"
+        )
+    finally:
+        await conn.close()
+    return {
+        "track_nos": [row["track_no"] for row in rows],
+        "customers": [row["customer_id"] for row in rows if row["customer_id"]],
+    }
+
+
+def scenarios(keys: Dict[str, List[str]], rng: random.Random) -> Dict[str, Callable[[int], Request]]:
+    """
+    Request factories per endpoint; `i` is the request number within the run
+    """
+    track_nos, customers = keys["track_nos"], keys["customers"]
+
+    def webhook(i: int) -> Request:
+        # 70% status updates for existing (benchmark-owned) shipments, 30% new shipments
+        if rng.random() < 0.7:
+            track_no = update_track_no(rng.randrange(BENCH_UPDATE_ROWS))
+        else:
+            track_no = f"{BENCH_TRACK_PREFIX}N{i:09d}"
+        code, desc, _ = rng.choice(bulk_load.STATUSES)
+        return ("POST", "/webhook", {
+            "trackNo": track_no,
+            "ref1": rng.choice(customers),
+            "statusCode": code,
+            "statusDescHeb": desc,
+            "currentLocation": rng.choice(bulk_load.LOCATIONS),
+            "lastScanTime": datetime.utcnow().isoformat(),
+        })
+
+    def customer_shipments(i: int) -> Request:
+        return ("GET", f"/api/v1/shipments/customer/{rng.choice(customers)}?limit=50", None)
+
+    def track(i: int) -> Request:
+        return ("GET", f"/api/v1/shipments/track/{rng.choice(track_nos)}", None)
+
+    def dashboard(i: int) -> Request:
+        return ("GET", "/", None)
+
+    return {
+        "receive_webhook": webhook,
+        "get_customer_shipments": customer_shipments,
+        "track_shipment": track,
+        "dashboard": dashboard,
+    }
+
+
+def percentile(quantiles: List[float], p: int) -> float:
+    return round(quantiles[p - 1], 3)
+
+
+async def run_scenario(client: httpx.AsyncClient, factory, requests: int, warmup: int,
+                       concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(warmup + requests))
+
+    async def worker():
+        for i in counter:
+            method, path, body = factory(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            if i >= warmup:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        # warmup requests share the wall clock, so count them in the rate too
+        "throughput_rps": round((warmup + requests) / wall, 1),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": percentile(quantiles, 50),
+        "p95_ms": percentile(quantiles, 95),
+        "p99_ms": percentile(quantiles, 99),
+        "max_ms": round(max(latencies), 3),
+    }
+
+
+@asynccontextmanager
+async def app_client(base_url: Optional[str], concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            yield client
+        return
+
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            yield client
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Returns a line per regressed endpoint: p95 up or throughput down by more than threshold
+    """
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        p95_change = result["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0
+        rps_change = result["throughput_rps"] / base["throughput_rps"] - 1 if base["throughput_rps"] else 0
+        line = (
+            f"{name:<24} p95 {base['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ms ({p95_change:+.0%})   "
+            f"rps {base['throughput_rps']:>8.1f} -> {result['throughput_rps']:>8.1f} ({rps_change:+.0%})"
+        )
+        if p95_change > threshold or rps_change < -threshold:
+            regressions.append(line)
+            line += "   ⚠️ REGRESSION"
+        print(line)
+    return regressions
+
+
+async def main(args) -> int:
+    engine.echo = False
+    size = SIZES[args.size]
+    only = set(args.only.split(",")) if args.only else None
+
+    await migrate(engine)
+    await seed(size, args.reseed)
+    keys = await sample_keys()
+    rng = random.Random(args.seed)
+    factories = scenarios(keys, rng)
+
+    results: Dict[str, Any] = {}
+    async with app_client(args.base_url, args.concurrency) as client:
+        for name, factory in factories.items():
+            if only and name not in only:
+                continue
+            results[name] = await run_scenario(
+                client, factory, args.requests, args.warmup, args.concurrency
+            )
+            r = results[name]
+            print(
+                f"{name:<24} {r['throughput_rps']:>8.1f} req/s   p50 {r['p50_ms']:>8.2f}   "
+                f"p95 {r['p95_ms']:>8.2f}   p99 {r['p99_ms']:>8.2f} ms   errors {r['errors']}"
+            )
+
+    run = {
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "dataset": {"size": args.size, "rows": size, "seed": DATA_SEED},
+        "concurrency": args.concurrency,
+        "requests_per_endpoint": args.requests,
+        "target": args.base_url or "in-process",
+        "scenarios": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{run['started_at'].replace(':', '')}-{args.size}.json"
+    )
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"\n💾 results saved to {output}")
+
+    # בסוף הריצה מוחקים את מה שה-webhook כתב, כדי שהריצה הבאה תתחיל מאותו dataset
+    conn = await asyncpg.connect(asyncpg_dsn(DATABASE_URL))
+    try:
+        await reset_benchmark_rows(conn)
+    finally:
+        await conn.close()
+    await engine.dispose()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\ncompared with {args.compare} (threshold {args.threshold:.0%}):")
+        if compare(run, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=SIZES, default="10k", help="seeded dataset size")
+    parser.add_argument("--reseed", action="store_true", help="reload the dataset even if it is already seeded")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per endpoint")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured requests per endpoint")
+    parser.add_argument("--only", help="comma-separated endpoints, e.g. receive_webhook,dashboard")
+    parser.add_argument("--seed", type=int, default=7, help="seed for the request mix")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>-<size>.json)")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed relative p95 increase / throughput drop before flagging")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,218 @@
+"""
+Benchmark: per-event webhook write, legacy ORM path vs INSERT ... ON CONFLICT
+
+Runs against the scratch database in BENCH_DATABASE_URL (required):
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://postgres@localhost/bench \\
+        python -m benchmarks.webhook_upsert --events 2000
+
+For each path it replays the same mix of new and repeated tracking numbers
+and reports database round trips per event and latency percentiles. The
+decode step (request bytes -> shipments row) is measured on its own first:
+json.loads + dict.get mapping vs WebhookPayload.model_validate_json
+(--decode-only skips the database runs).
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime
+
+import benchmarks._env  # noqa: F401 - before any app module reads DATABASE_URL
+
+from sqlalchemy import event, text
+from sqlalchemy.future import select
+
+from database.migrations import migrate
+from database.session import AsyncSessionLocal, engine
+from models.shipment import Shipment
+from services import change_events
+from services.shipment_upsert import payload_to_row, write_row
+from services.webhook_payload import WebhookPayload
+
+# column -> payload key, as the pre-WebhookPayload payload_to_row read it
+LEGACY_FIELDS = {
+    name: field.alias
+    for name, field in WebhookPayload.model_fields.items()
+    if name not in ("track_no", "status_code", "last_scan_time", "delivery_attempt_count", "signature_required")
+}
+
+
+def make_payload(track_no: str) -> dict:
+    return {
+        "trackNo": track_no,
+        "ref1": f"CUST{random.randint(1, 50):03d}",
+        "ref2": f"INV{random.randint(1, 99999):05d}",
+        "statusCode": str(random.choice([5, 10, 15, 20, 90])),
+        "statusDescHeb": "במעבר",
+        "currentLocation": "מרכז הפצה תל אביב",
+        "lastScanLocation": "נמל התעופה בן גוריון",
+        "deliveryAttemptCount": random.randint(0, 2),
+        "shipperName": "חברת ABC בע\"מ",
+        "recipientName": "יוסי כהן",
+        "lastScanTime": "2025-08-04T09:15:00Z",
+    }
+
+
+def legacy_decode(body: bytes, now: datetime) -> dict:
+    """The pre-WebhookPayload webhook: request.json() + payload_to_row over the dict"""
+    return legacy_row(json.loads(body), now)
+
+
+def legacy_row(data: dict, now: datetime) -> dict:
+    row = {"track_no": data.get("trackNo"), "status_code": int(data.get("statusCode", 0))}
+    for column, key in LEGACY_FIELDS.items():
+        row[column] = data.get(key)
+    scan_time = data.get("lastScanTime")
+    row["last_scan_time"] = (
+        datetime.fromisoformat(scan_time.replace("Z", "+00:00")).replace(tzinfo=None) if scan_time else None
+    )
+    row["delivery_attempt_count"] = data.get("deliveryAttemptCount", 0)
+    row["signature_required"] = data.get("signatureRequired", False)
+    row["created_at"] = now
+    row["updated_at"] = now
+    return row
+
+
+def typed_decode(body: bytes, now: datetime) -> dict:
+    return WebhookPayload.model_validate_json(body).to_row(now)
+
+
+def decode_cost(path: str, decode, bodies, rounds: int = 5) -> dict:
+    """Best of several passes over the same request bodies, in microseconds per event"""
+    now = datetime.utcnow()
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for body in bodies:
+            decode(body, now)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {"path": path, "events": len(bodies), "us_per_event": round(best / len(bodies) * 1e6, 2)}
+
+
+# the columns the baseline handler assigned on an existing shipment
+LEGACY_UPDATE_COLUMNS = [
+    "status_code", "status_desc", "exception_code", "exception_desc", "estimated_delivery",
+    "delivered_time", "received_by", "service_code", "current_location", "last_scan_location",
+    "last_scan_time", "delivery_attempt_count", "delivery_instructions", "signature_required",
+]
+
+
+async def legacy_write(db, data: dict):
+    """
+    The baseline receive_webhook body: SELECT, then mutate the ORM object or
+    add a new one with every payload field, commit. The baseline assigned
+    lastScanTime as the raw string, which asyncpg rejects for a TIMESTAMP
+    column; it is parsed here (as in legacy_decode) so the path can run.
+    """
+    now = datetime.utcnow()
+    row = legacy_row(data, now)
+    result = await db.execute(select(Shipment).where(Shipment.track_no == row["track_no"]))
+    shipment = result.scalars().first()
+    if shipment:
+        for column in LEGACY_UPDATE_COLUMNS:
+            setattr(shipment, column, row[column])
+        shipment.updated_at = now
+    else:
+        db.add(Shipment(**row))
+    await db.commit()
+
+
+async def upsert_write(db, data: dict):
+    """
+    The shipped receive_webhook path: typed decode, write_row (upsert,
+    history and NOTIFY in one statement), commit, local publish
+    """
+    row = payload_to_row(data, datetime.utcnow())
+    written = await write_row(db, row)
+    await db.commit()
+    if written is not None:
+        change_events.publish([row["track_no"]])
+
+
+async def run(path: str, writer, payloads) -> dict:
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    async with engine.begin() as conn:
+        await conn.execute(text("TRUNCATE shipments, shipment_events"))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    latencies = []
+    try:
+        for data in payloads:
+            async with AsyncSessionLocal() as db:
+                started = time.perf_counter()
+                await writer(db, data)
+                latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    latencies.sort()
+    return {
+        "path": path,
+        "events": len(payloads),
+        # every commit is one more round trip on top of the executed statements
+        "round_trips_per_event": round((statements + len(payloads)) / len(payloads), 2),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 3),
+    }
+
+
+async def main(events: int, repeat_ratio: float, decode_only: bool):
+    engine.echo = False
+    random.seed(42)
+
+    track_nos = []
+    for i in range(events):
+        if track_nos and random.random() < repeat_ratio:
+            track_nos.append(random.choice(track_nos))
+        else:
+            track_nos.append(f"1ZBENCH{i:010d}")
+    payloads = [make_payload(track_no) for track_no in track_nos]
+
+    bodies = [json.dumps(payload, ensure_ascii=False).encode("utf-8") for payload in payloads]
+    decodes = [
+        decode_cost("json.loads + dict mapping", legacy_decode, bodies),
+        decode_cost("WebhookPayload.model_validate_json", typed_decode, bodies),
+    ]
+    for result in decodes:
+        print(result)
+    print(f"decode: {decodes[0]['us_per_event']}us -> {decodes[1]['us_per_event']}us per event\n")
+    if decode_only:
+        await engine.dispose()
+        return
+
+    await migrate(engine)
+
+    results = [
+        await run("legacy_orm", legacy_write, payloads),
+        await run("upsert", upsert_write, payloads),
+    ]
+    for result in results:
+        print(result)
+
+    legacy, upsert = results
+    print(
+        f"round trips: {legacy['round_trips_per_event']} -> {upsert['round_trips_per_event']}, "
+        f"p50: {legacy['p50_ms']}ms -> {upsert['p50_ms']}ms"
+    )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--repeat-ratio", type=float, default=0.7,
+                        help="fraction of events that update an existing tracking number")
+    parser.add_argument("--decode-only", action="store_true",
+                        help="only measure payload decoding, without a database")
+    args = parser.parse_args()
+    asyncio.run(main(args.events, args.repeat_ratio, args.decode_only))
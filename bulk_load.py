@@ -0,0 +1,255 @@
+"""
+Bulk loader and synthetic data generator for the shipments table
+
+Load NDJSON webhook payloads (one JSON object per line, same fields as
+POST /webhook) through COPY into a staging table and merge them with the
+same insert-only / update column split as the webhook upsert:
+
+    python bulk_load.py --database-url postgresql://... load payloads.ndjson
+
+Generate realistic, seeded data - either as NDJSON or straight into the
+database:
+
+    python bulk_load.py generate --rows 1000000 --out payloads.ndjson
+    BULK_LOAD_DATABASE_URL=postgresql://... python bulk_load.py generate --rows 10000000 --customers 20000 --load
+
+The target database is never taken from DATABASE_URL (or .env, which
+points at the app's database): it has to be given with --database-url or
+BULK_LOAD_DATABASE_URL.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List
+
+import asyncpg
+
+from database.session import asyncpg_dsn
+from models.shipment import Shipment
+from models.shipment_status import KNOWN_STATUSES
+from services.shipment_upsert import (
+    EVENT_FIELDS,
+    ROW_COLUMNS,
+    UPDATE_COLUMNS,
+    PayloadError,
+    payload_to_row,
+)
+
+CHUNK_ROWS = 100_000
+
+# התפלגות משוערת של סטטוסים במשלוחים פעילים; התוויות ממילון הסטטוסים
+STATUS_WEIGHTS = {1: 0.08, 5: 0.18, 10: 0.34, 15: 0.08, 20: 0.29, 90: 0.03}
+STATUSES = [(code, label_he, STATUS_WEIGHTS[code]) for code, label_he, _ in KNOWN_STATUSES]
+EXCEPTIONS = [
+    ("DEL001", "כתובת לא מדויקת - נדרש תיקון"),
+    ("DEL002", "הנמען לא נמצא בבית"),
+    ("CUS001", "עיכוב במכס"),
+]
+LOCATIONS = [
+    "מרכז הפצה תל אביב", "נמל התעופה בן גוריון", "חיפה - מרכז הפצה",
+    "ירושלים - מרכז הפצה", "באר שבע - מרכז הפצה", "ברכב המשלוחים",
+]
+SERVICES = ["UPS_GROUND", "UPS_NEXT_DAY", "UPS_2DAY", "UPS_EXPRESS"]
+
+# coercion for COPY, which needs exact Python types per column
+COLUMN_TYPES = {column.name: column.type.python_type for column in Shipment.__table__.columns}
+
+
+def _coerce(value: Any, python_type: type) -> Any:
+    if value is None or isinstance(value, python_type):
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(str(value))
+    if python_type is bool:
+        return str(value).lower() in ("1", "true", "yes")
+    return python_type(value)
+
+
+def to_record(row: Dict[str, Any], seq: int) -> tuple:
+    return (seq, *(_coerce(row[column], COLUMN_TYPES[column]) for column in ROW_COLUMNS))
+
+
+def read_payloads(path: str) -> Iterator[Dict[str, Any]]:
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as source:
+        for line_no, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                print(f"שורה {line_no}: JSON לא תקין ({e}), מדלג", file=sys.stderr)
+
+
+def generate_payloads(rows: int, customers: int, days: int, seed: int) -> Iterator[Dict[str, Any]]:
+    """
+    נתונים סינתטיים עם התפלגות ריאליסטית: מעט לקוחות B2B גדולים (Zipf),
+    התפלגות סטטוסים ומיקומים, וזמנים פרוסים על פני `days` ימים
+    """
+    rng = random.Random(seed)
+    customer_weights = list(itertools.accumulate(1 / (rank ** 1.1) for rank in range(1, customers + 1)))
+    status_weights = list(itertools.accumulate(weight for _, _, weight in STATUSES))
+    now = datetime.utcnow().replace(microsecond=0)
+    span_seconds = days * 24 * 3600
+
+    for i in range(rows):
+        code, desc, _ = rng.choices(STATUSES, cum_weights=status_weights)[0]
+        customer = rng.choices(range(1, customers + 1), cum_weights=customer_weights)[0]
+        scanned = now - timedelta(seconds=rng.randrange(span_seconds))
+        payload = {
+            "trackNo": f"1Z{seed % 1000:03d}{customer % 1000:03d}{i:010d}",
+            "ref1": f"CUST{customer:06d}",
+            "ref2": f"INV{rng.randrange(10 ** 8):08d}",
+            "statusCode": code,
+            "statusDescHeb": desc,
+            "serviceCode": rng.choice(SERVICES),
+            "packageWeight": round(rng.lognormvariate(0.7, 0.8), 2),
+            "currentLocation": rng.choice(LOCATIONS),
+            "lastScanLocation": rng.choice(LOCATIONS),
+            "lastScanTime": scanned.isoformat(),
+            "deliveryAttemptCount": rng.choice((0, 0, 0, 1, 1, 2)) if code in (15, 20, 90) else 0,
+            "signatureRequired": rng.random() < 0.3,
+            "shippingCost": round(rng.uniform(20, 150), 2),
+        }
+        if code == 90:
+            payload["exceptionCode"], payload["exceptionDescHeb"] = rng.choice(EXCEPTIONS)
+        if code == 20:
+            payload["deliveredTime"] = scanned.strftime("%Y-%m-%d %H:%M:%S")
+            payload["receivedBy"] = "חתימה אלקטרונית"
+        yield payload
+
+
+def _merge_sql(with_events: bool) -> str:
+    insert_columns = ", ".join(ROW_COLUMNS)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in UPDATE_COLUMNS)
+    # DISTINCT ON + ORDER BY seq DESC: השורה האחרונה מחליפה את כולה, כמו merge_payloads
+    latest = (
+        f"SELECT DISTINCT ON (track_no) {insert_columns} FROM shipments_stage "
+        f"ORDER BY track_no, seq DESC"
+    )
+    merge = (
+        f"INSERT INTO shipments ({insert_columns}) SELECT {insert_columns} FROM latest "
+        f"ON CONFLICT (track_no) DO UPDATE SET {updates} "
+        f"WHERE shipments.status_hash IS DISTINCT FROM EXCLUDED.status_hash"
+    )
+    if not with_events:
+        return f"WITH latest AS ({latest}) {merge}"
+    # כמו upsert_payloads: כל אירוע בהיסטוריה, גם כפילויות שאוחדו, אבל רק
+    # למשלוחים שה-merge כתב בפועל (סטטוס שלא השתנה לא נרשם)
+    event_columns = ", ".join(EVENT_FIELDS)
+    return (
+        f"WITH latest AS ({latest}), written AS ({merge} RETURNING track_no) "
+        f"INSERT INTO shipment_events ({event_columns}, received_at) "
+        f"SELECT {event_columns}, updated_at FROM shipments_stage JOIN written USING (track_no) "
+        f"ORDER BY seq"
+    )
+
+
+async def load_rows(conn, rows: Iterable[Dict[str, Any]], with_events: bool) -> int:
+    """
+    COPY ל-staging table זמנית ומיזוג ל-shipments, chunk אחד לכל טרנזקציה
+    """
+    merge_sql = _merge_sql(with_events)
+    total = 0
+    seq = itertools.count()
+    iterator = iter(rows)
+    while True:
+        records = [to_record(row, next(seq)) for row in itertools.islice(iterator, CHUNK_ROWS)]
+        if not records:
+            break
+        started = time.perf_counter()
+        async with conn.transaction():
+            await conn.execute(
+                f"CREATE TEMP TABLE shipments_stage ON COMMIT DROP AS "
+                f"SELECT 0::bigint AS seq, {', '.join(ROW_COLUMNS)} FROM shipments WITH NO DATA"
+            )
+            await conn.copy_records_to_table(
+                "shipments_stage", records=records, columns=["seq", *ROW_COLUMNS]
+            )
+            await conn.execute(merge_sql)
+        total += len(records)
+        elapsed = time.perf_counter() - started
+        print(f"✓ {total:,} שורות ({len(records) / elapsed:,.0f} שורות/שנייה)")
+    return total
+
+
+def payload_rows(payloads: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    now = datetime.utcnow()
+    for payload in payloads:
+        try:
+            row = payload_to_row(payload, now)
+        except PayloadError as e:
+            print(f"payload לא תקין ({e}), מדלג", file=sys.stderr)
+            continue
+        # זמני הסריקה משמשים כזמן העדכון כשטוענים היסטוריה
+        if row["last_scan_time"] is not None:
+            row["updated_at"] = row["last_scan_time"]
+        yield row
+
+
+async def run_load(database_url: str, payloads: Iterable[Dict[str, Any]], with_events: bool):
+    started = time.perf_counter()
+    conn = await asyncpg.connect(asyncpg_dsn(database_url))
+    try:
+        total = await load_rows(conn, payload_rows(payloads), with_events)
+    finally:
+        await conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"\n🎉 נטענו {total:,} שורות ב-{elapsed:.1f} שניות ({total / max(elapsed, 1e-9) * 60:,.0f} לדקה)")
+
+
+def write_ndjson(payloads: Iterable[Dict[str, Any]], path: str):
+    with open(path, "w", encoding="utf-8") as out:
+        for payload in payloads:
+            out.write(json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+            out.write("\n")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Bulk loader and synthetic data generator for shipments")
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("BULK_LOAD_DATABASE_URL"),
+        help="target database (default: $BULK_LOAD_DATABASE_URL; DATABASE_URL is never used)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="COPY NDJSON webhook payloads into shipments")
+    load.add_argument("path", help="NDJSON file, or - for stdin")
+    load.add_argument("--no-events", action="store_true", help="skip shipment_events history rows")
+
+    generate = commands.add_parser("generate", help="generate seeded synthetic payloads")
+    generate.add_argument("--rows", type=int, default=100_000)
+    generate.add_argument("--customers", type=int, default=5_000)
+    generate.add_argument("--days", type=int, default=90)
+    generate.add_argument("--seed", type=int, default=42)
+    target = generate.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out", help="write NDJSON to this file")
+    target.add_argument("--load", action="store_true", help="COPY straight into the database")
+    generate.add_argument("--events", action="store_true", help="also write shipment_events rows when loading")
+
+    args = parser.parse_args(argv)
+    writes_database = args.command == "load" or args.load
+    if writes_database and not args.database_url:
+        # בלי fallback ל-DATABASE_URL: ב-.env הוא מצביע על הדאטאבייס של האפליקציה
+        parser.error("the target database is required: pass --database-url or set BULK_LOAD_DATABASE_URL")
+
+    if args.command == "load":
+        asyncio.run(run_load(args.database_url, read_payloads(args.path), with_events=not args.no_events))
+        return
+
+    payloads = generate_payloads(args.rows, args.customers, args.days, args.seed)
+    if args.out:
+        write_ndjson(payloads, args.out)
+    else:
+        asyncio.run(run_load(args.database_url, payloads, with_events=args.events))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Background database health monitor with a circuit breaker and pool statistics
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from services.metrics import DB_POOL_CHECKOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PROBE_INTERVAL_SECONDS = float(os.getenv("DB_HEALTH_PROBE_SECONDS", "10"))
+OPEN_PROBE_INTERVAL_SECONDS = float(os.getenv("DB_HEALTH_OPEN_PROBE_SECONDS", "2"))
+PROBE_TIMEOUT_SECONDS = float(os.getenv("DB_HEALTH_PROBE_TIMEOUT_SECONDS", "3"))
+FAILURE_THRESHOLD = int(os.getenv("DB_HEALTH_FAILURE_THRESHOLD", "3"))
+
+CLOSED = "closed"        # הדאטאבייס תקין, בקשות עוברות
+OPEN = "open"            # הדאטאבייס לא זמין, בקשות נכשלות מיד
+HALF_OPEN = "half_open"  # בדיקה הצליחה, ממתינים לאישור מבקשה אמיתית
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of touching the pool while the circuit is open"""
+
+
+class DatabaseHealthMonitor:
+    def __init__(self, engine: AsyncEngine, max_overflow: int):
+        self.engine = engine
+        self.max_overflow = max_overflow
+        # הבדיקה פותחת חיבור משלה: pool עמוס הוא לא דאטאבייס שנפל
+        self._probe_engine = create_async_engine(engine.url, poolclass=NullPool)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_probe_at: Optional[float] = None
+        self.last_probe_ms: Optional[float] = None
+        self.opened_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.probes = 0
+        self.probe_failures = 0
+        self.checkouts = 0
+        self.checkout_waits = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.checkout_total_ms = 0.0
+        self.checkout_max_ms = 0.0
+
+    def available(self) -> bool:
+        return self.state != OPEN
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="db-health-monitor")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            await self.probe()
+            interval = OPEN_PROBE_INTERVAL_SECONDS if self.state == OPEN else PROBE_INTERVAL_SECONDS
+            await asyncio.sleep(interval)
+
+    async def probe(self) -> bool:
+        """
+        בדיקת חיבור יזומה - רצה ברקע ולא בנתיב הבקשה
+        """
+        self.probes += 1
+        started = time.perf_counter()
+        try:
+            # ה-timeout כולל גם את פתיחת החיבור, לא רק את השאילתה
+            await asyncio.wait_for(self._select_one(), PROBE_TIMEOUT_SECONDS)
+        except Exception as e:
+            self.probe_failures += 1
+            self._record_failure(f"probe failed: {e!r}")
+            return False
+        finally:
+            self.last_probe_at = time.time()
+            self.last_probe_ms = (time.perf_counter() - started) * 1000
+
+        if self.state == OPEN:
+            # חיבורים ישנים ב-pool כנראה מתים אחרי נפילה - מתחילים מחדש
+            await self.engine.dispose()
+            self.state = HALF_OPEN
+            logger.info("Database probe succeeded, circuit half-open")
+        elif self.state == HALF_OPEN:
+            self._close()
+        self.consecutive_failures = 0
+        return True
+
+    async def _select_one(self):
+        async with self._probe_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    def _pool_exhausted(self) -> bool:
+        pool = self.engine.sync_engine.pool
+        if not hasattr(pool, "checkedout") or self.max_overflow < 0:
+            # overflow ללא הגבלה - אף פעם לא ממתינים
+            return False
+        return pool.checkedout() >= pool.size() + self.max_overflow
+
+    async def timed_checkout(self, session: AsyncSession):
+        """
+        Check out the session's connection up front, timing the pool wait
+        """
+        if self._pool_exhausted():
+            # כל החיבורים (כולל overflow) תפוסים - נמתין לשחרור
+            self.checkout_waits += 1
+        started = time.perf_counter()
+        try:
+            await session.connection()
+        except PoolTimeout as e:
+            # pool_timeout: הדאטאבייס עונה, רק כל החיבורים תפוסים - לא פותחים את ה-circuit
+            self.checkout_timeouts += 1
+            raise DatabaseUnavailable(str(e)) from e
+        except Exception as e:
+            self.checkout_failures += 1
+            self._record_failure(f"checkout failed: {e!r}")
+            raise DatabaseUnavailable(str(e)) from e
+        elapsed = (time.perf_counter() - started) * 1000
+        DB_POOL_CHECKOUT_SECONDS.observe(elapsed / 1000)
+        self.checkouts += 1
+        self.checkout_total_ms += elapsed
+        self.checkout_max_ms = max(self.checkout_max_ms, elapsed)
+        if self.state == HALF_OPEN:
+            self._close()
+
+    def _record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= FAILURE_THRESHOLD
+        ):
+            self.state = OPEN
+            self.opened_at = time.time()
+            logger.error(f"Database circuit opened after {self.consecutive_failures} failures: {error}")
+
+    def _close(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        logger.info("Database circuit closed")
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.engine.sync_engine.pool
+        pool_stats: Dict[str, Any] = {"status": pool.status()}
+        if hasattr(pool, "checkedout"):
+            pool_stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "opened_at": self.opened_at,
+            "last_probe_at": self.last_probe_at,
+            "last_probe_ms": round(self.last_probe_ms, 2) if self.last_probe_ms is not None else None,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "pool": pool_stats,
+            "checkouts": self.checkouts,
+            "checkout_waits": self.checkout_waits,
+            "checkout_failures": self.checkout_failures,
+            "checkout_timeouts": self.checkout_timeouts,
+            "checkout_avg_ms": round(self.checkout_total_ms / self.checkouts, 3) if self.checkouts else None,
+            "checkout_max_ms": round(self.checkout_max_ms, 3),
+        }
@@ -0,0 +1,274 @@
+"""
+Versioned schema migrations
+
+Each revision runs once and is recorded in schema_migrations. A regular
+revision runs all of its DDL in one transaction together with its version
+row, under lock_timeout / statement_timeout: a revision that cannot get its
+lock quickly fails and is retried, instead of queueing webhook writes
+behind an ACCESS EXCLUSIVE lock request. Revisions marked concurrent run in
+autocommit, because CREATE INDEX CONCURRENTLY cannot run in a transaction,
+and drop the INVALID leftover of an interrupted build before retrying it.
+
+App startup only reads the recorded version (check_schema_version). The
+migrations themselves run from migrate_table.py, once, before the server
+starts its workers (render.yaml startCommand).
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Union
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from database.partitions import ensure_event_partitions
+from database.session import Base
+# every model has to be registered on Base before the baseline's create_all
+from models.shipment import Shipment  # noqa: F401
+from models.shipment_event import ShipmentEvent  # noqa: F401
+from models.shipment_status import ShipmentStatus, ensure_status_labels  # noqa: F401
+from models.webhook_idempotency_key import WebhookIdempotencyKey  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_TABLE = "schema_migrations"
+LOCK_TIMEOUT = os.getenv("DB_MIGRATION_LOCK_TIMEOUT", "5s")
+STATEMENT_TIMEOUT = os.getenv("DB_MIGRATION_STATEMENT_TIMEOUT", "30min")
+LOCK_RETRIES = int(os.getenv("DB_MIGRATION_LOCK_RETRIES", "5"))
+# רק runner אחד בכל פעם (כמה workers / deploy חופף)
+ADVISORY_LOCK_KEY = "ups-tracker-migrations"
+LOCK_NOT_AVAILABLE = "55P03"
+
+Step = Union[str, Callable[..., Awaitable[None]]]
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    steps: Sequence[Step]
+    concurrent: bool = False
+
+
+class SchemaOutdated(RuntimeError):
+    """Raised at startup when the database is behind the code's schema version"""
+
+
+async def _create_tables(conn):
+    # checkfirst: טבלאות קיימות (והאינדקסים שלהן) לא נוגעים בהן
+    await conn.run_sync(Base.metadata.create_all)
+
+
+def create_index_concurrently(name: str, definition: str) -> Callable[..., Awaitable[None]]:
+    """
+    CREATE INDEX CONCURRENTLY step; definition is everything after the index name
+    """
+    async def step(conn):
+        valid = await conn.scalar(text(
+            "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(:name)"
+        ), {"name": name})
+        if valid is False:
+            # בנייה CONCURRENTLY שנקטעה משאירה אינדקס INVALID, ו-IF NOT EXISTS היה מדלג עליו
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}"))
+
+    step.__name__ = f"create_index_concurrently({name})"
+    return step
+
+
+def create_trigram_index(name: str, table: str, column: str) -> Callable[..., Awaitable[None]]:
+    """
+    pg_trgm GIN index for ILIKE '%...%' search. The extension ships with
+    contrib, which not every Postgres has: without it the step logs and
+    skips, and the search keeps working as a scan. The revision is recorded
+    either way, so enabling pg_trgm later needs a new revision
+    """
+    build = create_index_concurrently(name, f"ON {table} USING gin ({column} gin_trgm_ops)")
+
+    async def step(conn):
+        try:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except DBAPIError as e:
+            logger.warning(f"pg_trgm is not available, {name} is not created: {e.orig}")
+            return
+        await build(conn)
+
+    step.__name__ = f"create_trigram_index({name})"
+    return step
+
+
+# עמודות ה-UPS API - פקודת ALTER אחת, נעילה אחת על shipments
+_SHIPMENT_COLUMNS = [
+    ("service_code", "VARCHAR"),
+    ("package_weight", "FLOAT"),
+    ("package_dimensions", "VARCHAR"),
+    ("shipper_name", "VARCHAR"),
+    ("shipper_address", "TEXT"),
+    ("recipient_name", "VARCHAR"),
+    ("recipient_address", "TEXT"),
+    ("current_location", "VARCHAR"),
+    ("last_scan_location", "VARCHAR"),
+    ("last_scan_time", "TIMESTAMP"),
+    ("delivery_attempt_count", "INTEGER DEFAULT 0"),
+    ("delivery_instructions", "TEXT"),
+    ("signature_required", "BOOLEAN DEFAULT FALSE"),
+    ("ref1", "VARCHAR"),
+    ("ref2", "VARCHAR"),
+    ("ref3", "VARCHAR"),
+    ("shipping_cost", "FLOAT"),
+    ("insurance_value", "FLOAT"),
+    ("status_hash", "VARCHAR(32)"),
+]
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", [_create_tables, ensure_event_partitions, ensure_status_labels]),
+    Migration(2, "shipments_ups_api_columns", [
+        "ALTER TABLE shipments "
+        + ", ".join(f"ADD COLUMN IF NOT EXISTS {name} {ddl}" for name, ddl in _SHIPMENT_COLUMNS),
+    ]),
+    Migration(3, "shipments_list_indexes", [
+        create_index_concurrently(
+            "ix_shipments_customer_updated_id",
+            "ON shipments (customer_id, updated_at DESC NULLS LAST, id DESC)",
+        ),
+        create_index_concurrently(
+            "ix_shipments_updated_id",
+            "ON shipments (updated_at DESC NULLS LAST, id DESC)",
+        ),
+        create_index_concurrently(
+            "ix_shipments_customer_status_updated_id",
+            "ON shipments (customer_id, status_code, updated_at DESC NULLS LAST, id DESC)",
+        ),
+    ], concurrent=True),
+    Migration(4, "shipments_status_desc_trgm", [
+        create_trigram_index("ix_shipments_status_desc_trgm", "shipments", "status_desc"),
+    ], concurrent=True),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def _run_step(conn, step: Step):
+    if isinstance(step, str):
+        await conn.execute(text(step))
+    else:
+        await step(conn)
+
+
+async def _ensure_schema_table(conn):
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} ("
+        f"version INTEGER PRIMARY KEY, "
+        f"name VARCHAR NOT NULL, "
+        f"applied_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'), "
+        f"duration_ms INTEGER)"
+    ))
+
+
+async def _record(conn, migration: Migration, started: float):
+    await conn.execute(
+        text(f"INSERT INTO {SCHEMA_TABLE} (version, name, duration_ms) VALUES (:version, :name, :duration_ms)"),
+        {
+            "version": migration.version,
+            "name": migration.name,
+            "duration_ms": int((time.perf_counter() - started) * 1000),
+        },
+    )
+
+
+async def _apply(engine, migration: Migration):
+    started = time.perf_counter()
+    if not migration.concurrent:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+            await conn.execute(text(f"SET LOCAL statement_timeout = '{STATEMENT_TIMEOUT}'"))
+            for step in migration.steps:
+                await _run_step(conn, step)
+            await _record(conn, migration, started)
+        return
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+        await conn.execute(text(f"SET statement_timeout = '{STATEMENT_TIMEOUT}'"))
+        try:
+            # כל step עומד בפני עצמו ו-idempotent, כך שריצה שנקטעה פשוט ממשיכה
+            for step in migration.steps:
+                await _run_step(conn, step)
+            await _record(conn, migration, started)
+        finally:
+            # the connection goes back to the pool
+            await conn.execute(text("RESET lock_timeout"))
+            await conn.execute(text("RESET statement_timeout"))
+
+
+async def _apply_with_retries(engine, migration: Migration):
+    for attempt in range(1, LOCK_RETRIES + 1):
+        try:
+            await _apply(engine, migration)
+            return
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE or attempt == LOCK_RETRIES:
+                raise
+            delay = min(2 ** attempt, 30)
+            logger.warning(
+                f"Migration {migration.version} ({migration.name}) hit lock_timeout "
+                f"(attempt {attempt}/{LOCK_RETRIES}), retrying in {delay}s"
+            )
+            await asyncio.sleep(delay)
+
+
+async def applied_migrations(conn) -> Dict[int, str]:
+    exists = await conn.scalar(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": SCHEMA_TABLE})
+    if not exists:
+        return {}
+    result = await conn.execute(text(f"SELECT version, name FROM {SCHEMA_TABLE}"))
+    return {version: name for version, name in result}
+
+
+async def current_version(engine) -> Optional[int]:
+    """
+    Highest applied version, or None when migrations never ran
+    """
+    async with engine.connect() as conn:
+        applied = await applied_migrations(conn)
+    return max(applied) if applied else None
+
+
+async def migrate(engine, target: Optional[int] = None) -> List[Migration]:
+    """
+    Applies pending revisions up to target (default: all); returns what ran
+    """
+    target = LATEST_VERSION if target is None else target
+    ran = []
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.execute(text("SELECT pg_advisory_lock(hashtext(:key))"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            await _ensure_schema_table(lock_conn)
+            applied = await applied_migrations(lock_conn)
+            for migration in MIGRATIONS:
+                if migration.version in applied or migration.version > target:
+                    continue
+                logger.info(f"Applying migration {migration.version}: {migration.name}")
+                await _apply_with_retries(engine, migration)
+                ran.append(migration)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": ADVISORY_LOCK_KEY})
+    return ran
+
+
+async def check_schema_version(engine) -> int:
+    """
+    Startup check - one indexed read instead of reflecting the whole schema
+    """
+    version = await current_version(engine)
+    if version is None or version < LATEST_VERSION:
+        raise SchemaOutdated(
+            f"database schema is at version {version}, the code needs {LATEST_VERSION}; "
+            f"run: python migrate_table.py"
+        )
+    if version > LATEST_VERSION:
+        # deploy מתגלגל: קוד ישן מול סכמה חדשה יותר
+        logger.warning(f"Database schema version {version} is newer than this code ({LATEST_VERSION})")
+    return version
@@ -0,0 +1,55 @@
+"""
+Monthly partition maintenance for shipment_events
+"""
+import asyncio
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "shipment_events"
+MONTHS_AHEAD = 3
+MAINTENANCE_INTERVAL_SECONDS = 12 * 60 * 60
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    return date(day.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month_start: date) -> str:
+    return f"{PARENT_TABLE}_y{month_start.year}m{month_start.month:02d}"
+
+
+async def ensure_event_partitions(conn, today: date = None, months_ahead: int = MONTHS_AHEAD):
+    """
+    יצירת partitions לחודש הנוכחי ולחודשים הבאים, ו-DEFAULT partition כרשת ביטחון
+    """
+    today = today or datetime.utcnow().date()
+    first = date(today.year, today.month, 1)
+    for offset in range(months_ahead + 1):
+        start = _add_months(first, offset)
+        end = _add_months(first, offset + 1)
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {PARENT_TABLE}_default PARTITION OF {PARENT_TABLE} DEFAULT"
+    ))
+
+
+async def partition_maintenance_loop(engine):
+    """
+    Keeps MONTHS_AHEAD partitions ahead of the clock for long-running processes
+    """
+    while True:
+        # גם בעלייה - המיגרציה יצרה partitions רק לחודשים שסביב הרצתה
+        try:
+            async with engine.begin() as conn:
+                await ensure_event_partitions(conn)
+        except Exception as e:
+            logger.error(f"shipment_events partition maintenance failed: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
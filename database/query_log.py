@@ -0,0 +1,207 @@
+"""
+Slow-query log with sampled EXPLAIN (ANALYZE, BUFFERS)
+
+Replaces engine echo. Statements faster than the threshold cost one clock
+read; slower ones are logged as a JSON record with the route that issued
+them. A sample of slow SELECTs that read from a table (and call no
+side-effecting function) is re-run under EXPLAIN (ANALYZE, BUFFERS)
+by a background task, so the plan (and any Seq Scan that points at a
+missing index) is captured without delaying the request.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from services.metrics import current_route, normalize_statement
+
+logger = logging.getLogger("slow_query")
+
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+EXPLAIN_SAMPLE_RATE = float(os.getenv("DB_EXPLAIN_SAMPLE_RATE", "0.05"))
+EXPLAIN_QUEUE_SIZE = int(os.getenv("DB_EXPLAIN_QUEUE_SIZE", "20"))
+EXPLAIN_TIMEOUT_MS = int(os.getenv("DB_EXPLAIN_TIMEOUT_MS", "5000"))
+RECENT_ENTRIES = 50
+
+# EXPLAIN ANALYZE מריץ את השאילתה בפועל: SELECT בלי FROM הוא קריאה לפונקציה
+# (pg_advisory_lock, pg_notify), ופונקציות עם תופעות לוואי לא נדגמות גם בתוך שאילתה
+_FROM_CLAUSE = re.compile(r"\bFROM\b", re.IGNORECASE)
+_SIDE_EFFECT_CALL = re.compile(
+    r"\b(pg_advisory\w*|pg_try_advisory\w*|pg_notify|nextval|setval|pg_sleep\w*"
+    r"|pg_terminate_backend|pg_cancel_backend|set_config)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def explainable(statement: str) -> bool:
+    """
+    True for a SELECT that is safe to re-run under EXPLAIN ANALYZE
+    """
+    return (
+        statement.lstrip()[:6].upper() == "SELECT"
+        and _FROM_CLAUSE.search(statement) is not None
+        and _SIDE_EFFECT_CALL.search(statement) is None
+    )
+
+
+def _plan_summary(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Seq Scans, buffer totals and timings out of an EXPLAIN (FORMAT JSON) plan
+    """
+    seq_scans = []
+    nodes = [plan["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan":
+            seq_scans.append({
+                "relation": node.get("Relation Name"),
+                "filter": node.get("Filter"),
+                "rows": node.get("Actual Rows"),
+                "rows_removed": node.get("Rows Removed by Filter"),
+            })
+        nodes.extend(node.get("Plans", []))
+    top = plan["Plan"]
+    return {
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time"),
+        "shared_hit_blocks": top.get("Shared Hit Blocks"),
+        "shared_read_blocks": top.get("Shared Read Blocks"),
+        "seq_scans": seq_scans,
+    }
+
+
+class SlowQueryLog:
+    def __init__(self, engine, threshold_ms: float, sample_rate: float, queue_size: int):
+        self.engine = engine
+        self.threshold_seconds = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.recent: deque = deque(maxlen=RECENT_ENTRIES)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.slow_queries = 0
+        self.explained = 0
+        self.explain_dropped = 0
+        self.explain_failures = 0
+
+    def install(self, engine=None):
+        """
+        Listens on the engine (default: the one passed to the constructor);
+        sampled EXPLAINs run on the engine that executed the statement
+        """
+        engine = engine or self.engine
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("slow_log_started", []).append(time.perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["slow_log_started"].pop()
+            if elapsed >= self.threshold_seconds:
+                self._record(engine, statement, parameters, executemany, elapsed, cursor.rowcount)
+
+        @event.listens_for(sync_engine, "handle_error")
+        def _error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get("slow_log_started"):
+                conn.info["slow_log_started"].pop()
+
+    def _record(self, engine, statement: str, parameters, executemany: bool, elapsed: float, rowcount: int):
+        entry = {
+            "event": "slow_query",
+            "at": time.time(),
+            "route": current_route(),
+            "database": "primary" if engine is self.engine else "replica",
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": normalize_statement(statement),
+            "rowcount": rowcount,
+            "executemany": executemany,
+        }
+        self.slow_queries += 1
+        self.recent.append(entry)
+        # ערכי הפרמטרים לא נרשמים ללוג (מספרי מעקב, שמות נמענים)
+        logger.warning(json.dumps(entry, ensure_ascii=False))
+
+        if (
+            self._queue is not None
+            and not executemany
+            and explainable(statement)
+            and random.random() < self.sample_rate
+        ):
+            try:
+                self._queue.put_nowait((engine, entry, statement, tuple(parameters or ())))
+            except asyncio.QueueFull:
+                self.explain_dropped += 1
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run(), name="slow-query-explain")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._queue = None
+
+    async def _run(self):
+        while True:
+            engine, entry, statement, parameters = await self._queue.get()
+            try:
+                summary = await self._explain(engine, statement, parameters)
+            except Exception as e:
+                self.explain_failures += 1
+                logger.error(f"EXPLAIN failed for slow query on {entry['route']}: {e!r}")
+                continue
+            self.explained += 1
+            entry["plan"] = summary
+            logger.warning(json.dumps(
+                {"event": "slow_query_plan", "route": entry["route"], "statement": entry["statement"],
+                 "duration_ms": entry["duration_ms"], **{k: v for k, v in summary.items() if k != "plan"}},
+                ensure_ascii=False,
+            ))
+
+    async def _explain(self, engine, statement: str, parameters: Tuple[Any, ...]) -> Dict[str, Any]:
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            # ישירות מול asyncpg, כדי שה-EXPLAIN עצמו לא ייכנס ללוג ולמדדים
+            driver = raw.driver_connection
+            transaction = driver.transaction(readonly=True)
+            await transaction.start()
+            try:
+                await driver.execute(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                result = await driver.fetchval(
+                    f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", *parameters
+                )
+            finally:
+                await transaction.rollback()
+        plan = (json.loads(result) if isinstance(result, str) else result)[0]
+        summary = _plan_summary(plan)
+        summary["plan"] = plan["Plan"]
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_seconds * 1000,
+            "explain_sample_rate": self.sample_rate,
+            "slow_queries": self.slow_queries,
+            "explained": self.explained,
+            "explain_dropped": self.explain_dropped,
+            "explain_failures": self.explain_failures,
+            "pending_explains": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    def recent_entries(self) -> List[Dict[str, Any]]:
+        return list(reversed(self.recent))
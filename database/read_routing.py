@@ -0,0 +1,70 @@
+"""
+Read-your-writes window for the read engine
+
+A replica trails the primary by its replication lag, so a read right after
+a webhook can return the previous status. When DB_READ_YOUR_WRITES_SECONDS
+is set, every committed write (change_events) marks its track_nos, and
+reads of those track_nos go to the primary until the window passes.
+Writes from other workers arrive through LISTEN/NOTIFY, a few milliseconds
+after their commit. Independently of the window, the tracking cache loads
+its first fill after a write from the primary (services.tracking_cache).
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Iterable, List
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "0"))
+MAX_TRACKED_WRITES = int(os.getenv("DB_READ_YOUR_WRITES_MAX_KEYS", "100000"))
+
+
+class RecentWrites:
+    def __init__(self, window_seconds: float, max_keys: int):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        # track_no -> זמן הכתיבה, לפי סדר כתיבה (הישן בהתחלה)
+        self._written_at: "OrderedDict[str, float]" = OrderedDict()
+        self.primary_reads = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def note(self, track_nos: List[str]):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        for track_no in track_nos:
+            self._written_at[track_no] = now
+            self._written_at.move_to_end(track_no)
+        self._expire(now)
+
+    def _expire(self, now: float):
+        cutoff = now - self.window_seconds
+        written_at = self._written_at
+        while written_at:
+            track_no, at = next(iter(written_at.items()))
+            if at >= cutoff and len(written_at) <= self.max_keys:
+                break
+            written_at.popitem(last=False)
+
+    def recent(self, track_nos: Iterable[str]) -> bool:
+        """
+        True when any of the track_nos was written inside the window
+        """
+        if not self.enabled or not self._written_at:
+            return False
+        cutoff = time.monotonic() - self.window_seconds
+        for track_no in track_nos:
+            at = self._written_at.get(track_no)
+            if at is not None and at >= cutoff:
+                self.primary_reads += 1
+                return True
+        return False
+
+    def stats(self):
+        return {
+            "window_seconds": self.window_seconds,
+            "tracked": len(self._written_at),
+            "primary_reads": self.primary_reads,
+        }
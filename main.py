@@ -1,27 +1,82 @@
-from fastapi import FastAPI
+import time
+# נקודת ההתחלה של מדידת ה-cold start (import, startup, warm, first_response)
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import os
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
-from database.session import engine, Base
-# Import models BEFORE creating tables so they register with Base
-from models.shipment import Shipment
+from database.health import DatabaseUnavailable
+from database.migrations import SchemaOutdated, check_schema_version, migrate
+from database.partitions import partition_maintenance_loop
+from database.session import engine, db_health, query_log, read_db_health, recent_writes
 from routes.webhook import router as webhook_router
 from routes.dashboard import router as dashboard_router
 from routes.api import router as api_router
+from services import change_events
+from services.broadcaster import broadcaster
+from services.change_listener import change_listener
+from services.idempotency import idempotency_pruning_loop
+from services.ingest_queue import WRITE_BEHIND_ENABLED, ingest_queue
+from services.metrics import MetricsMiddleware, metrics_response, startup_timer
+from services.warmup import warmup
+
+startup_timer.start(IMPORT_STARTED)
+startup_timer.mark("import")
+
+# מיגרציות רצות ב-migrate_table.py לפני uvicorn (render.yaml); כאן רק לסביבת פיתוח
+MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables on startup
+    # Check the schema version on startup (one query, no reflection)
     try:
-        print("Creating database tables...")
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        print("Database tables created successfully")
+        if MIGRATE_ON_STARTUP:
+            for migration in await migrate(engine):
+                print(f"Applied migration {migration.version}: {migration.name}")
+        version = await check_schema_version(engine)
+        print(f"Database schema at version {version}")
+    except SchemaOutdated:
+        raise
     except Exception as e:
-        print(f"Error creating tables: {e}")
+        print(f"Error checking schema version: {e}")
+
+    await db_health.start()
+    await read_db_health.start()
+    await query_log.start()
+    partitions_task = asyncio.create_task(partition_maintenance_loop(engine))
+    idempotency_task = asyncio.create_task(idempotency_pruning_loop(engine))
+    await broadcaster.start()
+    if change_events.NOTIFY_ENABLED:
+        await change_listener.start()
+    if WRITE_BEHIND_ENABLED:
+        await ingest_queue.start()
+    # ברקע - /ready מחזיר 503 עד שה-pools חמים
+    await warmup.start()
+    startup_timer.mark("startup")
     yield
+    await warmup.stop()
+    # ריקון תור ה-webhooks לפני כיבוי
+    await ingest_queue.stop()
+    await change_listener.stop()
+    await broadcaster.stop()
+    partitions_task.cancel()
+    idempotency_task.cancel()
+    await query_log.stop()
+    await read_db_health.stop()
+    await db_health.stop()
 
 app = FastAPI(title="UPS Tracker", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(DatabaseUnavailable)
+async def database_unavailable_handler(request: Request, exc: DatabaseUnavailable):
+    # circuit פתוח או checkout שנכשל - הלקוח ינסה שוב בעוד רגע
+    print(f"Database unavailable: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Database unavailable"}, headers={"Retry-After": "2"})
 
 # ראוטרים
 app.include_router(webhook_router)
@@ -75,25 +130,22 @@ async def test_database():
 def root():
     return {"status": "UPS Tracker API is live!"}
 
-# Simple test route
-@app.get("/simple-test")
-async def simple_test():
-    try:
-        from database.session import AsyncSessionLocal
-        from sqlalchemy.future import select
-        
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Shipment))
-            shipments = result.scalars().all()
-            return {
-                "total_shipments": len(shipments),
-                "shipment_data": [
-                    {
-                        "track_no": s.track_no,
-                        "customer_id": s.customer_id,
-                        "status_desc": s.status_desc
-                    } for s in shipments[:3]  # First 3
-                ]
-            }
-    except Exception as e:
-        return {"error": str(e)}
+# readiness: 200 רק אחרי ה-warmup (חיבורים פתוחים, statements מוכנים, תבניות טעונות)
+@app.get("/ready")
+def ready():
+    return JSONResponse(warmup.stats(), status_code=200 if warmup.ready else 503)
+
+# מצב חיבור לדאטאבייס ונתוני pool - כתיבה וקריאה בנפרד
+@app.get("/health/db")
+def database_health():
+    return {**db_health.stats(), "read": read_db_health.stats(), "read_your_writes": recent_writes.stats()}
+
+# LISTEN/NOTIFY בין workers
+@app.get("/health/change-listener")
+def change_listener_health():
+    return change_listener.stats()
+
+# מדדי Prometheus
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
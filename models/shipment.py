@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, Index
 from datetime import datetime
 from database.session import Base
 
@@ -49,9 +49,33 @@ class Shipment(Base):
     shipping_cost = Column(Float, nullable=True)  # עלות משלוח
     insurance_value = Column(Float, nullable=True)  # ערך ביטוח
     
+    # טביעת אצבע של שדות הסטטוס האחרונים - webhook זהה לא נכתב שוב
+    status_hash = Column(String(32), nullable=True)
+
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime)
 
+    __table_args__ = (
+        # רשימת משלוחים ללקוח: WHERE customer_id ORDER BY updated_at DESC NULLS LAST, id DESC
+        Index(
+            "ix_shipments_customer_updated_id",
+            customer_id,
+            updated_at.desc().nulls_last(),
+            id.desc(),
+        ),
+        # הדשבורד: ORDER BY updated_at DESC NULLS LAST, id DESC בלי פילטר לקוח
+        Index("ix_shipments_updated_id", updated_at.desc().nulls_last(), id.desc()),
+        # פילטר status_code IN (...) ברשימת הלקוח, באותו סדר
+        Index(
+            "ix_shipments_customer_status_updated_id",
+            customer_id,
+            status_code,
+            updated_at.desc().nulls_last(),
+            id.desc(),
+        ),
+        # the pg_trgm index on status_desc is optional, see database/migrations.py
+    )
+
     def __repr__(self):
         return f"<Shipment(track_no='{self.track_no}', status='{self.status_desc}')>"
@@ -0,0 +1,35 @@
+from sqlalchemy import BigInteger, Column, DateTime, Identity, Index, Integer, String
+from database.session import Base
+
+class ShipmentEvent(Base):
+    """
+    היסטוריית סטטוסים - שורה לכל webhook, append-only.
+    Partitioned by month on received_at (see database/partitions.py).
+    """
+    __tablename__ = "shipment_events"
+
+    # the partition key has to be part of the primary key
+    id = Column(BigInteger, Identity(), primary_key=True)
+    received_at = Column(DateTime, primary_key=True, nullable=False)
+    track_no = Column(String, nullable=False)
+
+    status_code = Column(Integer)
+    status_desc = Column(String)
+    exception_code = Column(String, nullable=True)
+    exception_desc = Column(String, nullable=True)
+    estimated_delivery = Column(String, nullable=True)
+    delivered_time = Column(String, nullable=True)
+    received_by = Column(String, nullable=True)
+    current_location = Column(String, nullable=True)
+    last_scan_location = Column(String, nullable=True)
+    last_scan_time = Column(DateTime, nullable=True)
+    delivery_attempt_count = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # ציר זמן למשלוח: WHERE track_no ORDER BY received_at DESC, id DESC
+        Index("ix_shipment_events_track_received", track_no, received_at.desc(), id.desc()),
+        {"postgresql_partition_by": "RANGE (received_at)"},
+    )
+
+    def __repr__(self):
+        return f"<ShipmentEvent(track_no='{self.track_no}', status='{self.status_desc}', received_at='{self.received_at}')>"
@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.dialects.postgresql import insert
+from database.session import Base
+
+class ShipmentStatus(Base):
+    """
+    מילון סטטוסים: status_code -> תווית בעברית ובאנגלית.
+    Filters go through the indexed status_code instead of free-text status_desc.
+    """
+    __tablename__ = "shipment_statuses"
+
+    status_code = Column(Integer, primary_key=True, autoincrement=False)
+    label_he = Column(String, nullable=False)
+    label_en = Column(String, nullable=False)
+
+    def __repr__(self):
+        return f"<ShipmentStatus(status_code={self.status_code}, label_en='{self.label_en}')>"
+
+# קודי הסטטוס של UPS שהמערכת מכירה
+# נזרעים במיגרציה (database/migrations.py) - קוד חדש דורש revision חדש
+KNOWN_STATUSES = [
+    (1, "נקלט במערכת", "Label Created"),
+    (5, "בעיבוד", "Processing"),
+    (10, "במעבר", "In Transit"),
+    (15, "יצא למסירה", "Out for Delivery"),
+    (20, "נמסר", "Delivered"),
+    (90, "חריג", "Exception"),
+]
+
+async def ensure_status_labels(conn):
+    """
+    מוסיף קודים חסרים בלי לדרוס תוויות שנערכו ידנית
+    """
+    await conn.execute(
+        insert(ShipmentStatus)
+        .values([
+            {"status_code": code, "label_he": label_he, "label_en": label_en}
+            for code, label_he, label_en in KNOWN_STATUSES
+        ])
+        .on_conflict_do_nothing(index_elements=[ShipmentStatus.status_code])
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, DateTime
+from datetime import datetime
+from database.session import Base
+
+class WebhookIdempotencyKey(Base):
+    """
+    Idempotency-Key של webhooks שכבר טופלו. Keys expire after
+    WEBHOOK_IDEMPOTENCY_TTL_HOURS (see services/idempotency.py).
+    """
+    __tablename__ = "webhook_idempotency_keys"
+
+    key = Column(String(200), primary_key=True)
+    track_no = Column(String, nullable=True)  # ריק עבור batch
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<WebhookIdempotencyKey(key='{self.key}', track_no='{self.track_no}')>"
@@ -1,103 +1,358 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_
+from sqlalchemy import String, and_, any_, bindparam, func, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
 import logging
-from typing import List, Optional
+import zlib
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
 
-from database.session import get_db
+import orjson
+from pydantic import BaseModel
+
+from database.health import DatabaseUnavailable
+from database.session import get_read_db, read_db_health, read_engine, read_session_scope
 from models.shipment import Shipment
+from models.shipment_event import ShipmentEvent
+from models.shipment_status import ShipmentStatus
+from services.conditional import is_not_modified, make_etag, not_modified, validator_headers
+from services.pagination import (
+    encode_cursor,
+    fetch_updated_desc_page,
+    keyset_cursor,
+    parse_cursor_datetime,
+)
+from services.serialization import (
+    CUSTOMER_SHIPMENT_SPEC,
+    EVENT_SPEC,
+    TRACKING_SPEC,
+    ORJSONResponse,
+    encode_json,
+)
+from services.tracking_cache import tracking_cache
+from services.warmup import WARMUP_KEY, warmup
 
 router = APIRouter(prefix="/api/v1")
 logger = logging.getLogger(__name__)
 
+EXPORT_CHUNK_ROWS = 2000
+MAX_TRACK_BATCH_SIZE = 1000
+
+async def _customer_list_version(db: AsyncSession, customer_id: str, filters):
+    """
+    (last_modified, total) of a customer's list. last_modified is taken over
+    all of the customer's shipments: one that leaves a status filter bumps
+    its own updated_at, but not the max of the rows still matching. total
+    counts only the rows that pass the filters.
+    """
+    total = func.count().filter(and_(*filters)) if filters else func.count()
+    return (await db.execute(
+        select(func.max(Shipment.updated_at), total).where(Shipment.customer_id == customer_id)
+    )).one()
+
 @router.get("/shipments/customer/{customer_id}")
 async def get_customer_shipments(
     customer_id: str,
-    db: AsyncSession = Depends(get_db),
-    status: Optional[str] = Query(None, description="Filter by status"),
-    limit: int = Query(50, le=100, description="Maximum number of results")
+    request: Request,
+    after: Optional[List[Any]] = Depends(keyset_cursor),
+    db: AsyncSession = Depends(get_read_db),
+    status: Optional[str] = Query(None, description="Free-text match on the status description"),
+    status_code: Optional[List[int]] = Query(None, description="Filter by status codes (repeatable, see /statuses)"),
+    limit: int = Query(50, ge=1, le=100, description="Maximum number of results"),
 ):
     """
     קבלת משלוחים לפי מזהה לקוח - לשימוש WordPress
+
+    Keyset pagination over (updated_at DESC NULLS LAST, id DESC), served by
+    ix_shipments_customer_updated_id so deep pages cost the same as the first.
+    Conditional requests are answered with 304 from a max(updated_at)/count
+    aggregate before any rows are loaded. status_code filters use
+    ix_shipments_customer_status_updated_id; free-text status uses the
+    pg_trgm index on status_desc.
     """
     try:
-        query = select(Shipment).where(Shipment.customer_id == customer_id)
-        
+        filters = []
+        if status_code:
+            filters.append(Shipment.status_code.in_(status_code))
         if status:
-            query = query.where(Shipment.status_desc.ilike(f"%{status}%"))
-        
-        query = query.order_by(Shipment.updated_at.desc().nulls_last()).limit(limit)
-        
-        result = await db.execute(query)
-        shipments = result.scalars().all()
-        
-        return {
-            "customer_id": customer_id,
-            "total_shipments": len(shipments),
-            "shipments": [
-                {
-                    "track_no": s.track_no,
-                    "invoice_number": s.invoice_number,
-                    "status_code": s.status_code,
-                    "status_desc": s.status_desc,
-                    "exception_code": s.exception_code,
-                    "exception_desc": s.exception_desc,
-                    "estimated_delivery": s.estimated_delivery,
-                    "delivered_time": s.delivered_time,
-                    "received_by": s.received_by,
-                    "current_location": s.current_location,
-                    "last_scan_location": s.last_scan_location,
-                    "delivery_attempt_count": s.delivery_attempt_count,
-                    "created_at": s.created_at.isoformat() if s.created_at else None,
-                    "updated_at": s.updated_at.isoformat() if s.updated_at else None
-                }
-                for s in shipments
-            ]
-        }
+            filters.append(Shipment.status_desc.ilike(f"%{status}%"))
+
+        last_modified, total = await _customer_list_version(db, customer_id, filters)
+        etag = make_etag(customer_id, status, status_code, limit, after, last_modified, total)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+
+        shipments, next_cursor = await fetch_updated_desc_page(
+            db,
+            CUSTOMER_SHIPMENT_SPEC.query_columns(Shipment.id),
+            [Shipment.customer_id == customer_id, *filters],
+            after,
+            limit,
+        )
+
+        return ORJSONResponse(
+            {
+                "customer_id": customer_id,
+                "total_shipments": len(shipments),
+                "total": total,
+                "next_cursor": next_cursor,
+                "shipments": CUSTOMER_SHIPMENT_SPEC.rows(shipments),
+            },
+            headers=validator_headers(etag, last_modified),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching shipments for customer {customer_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+class TrackingEntry(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: Optional[datetime]
+
+def _tracking_etag(track_no: str, updated_at: Optional[datetime]) -> str:
+    return make_etag(track_no, updated_at)
+
+def _tracking_entry(row) -> TrackingEntry:
+    body = encode_json(TRACKING_SPEC.row(row))
+    return TrackingEntry(body, _tracking_etag(row.track_no, row.updated_at), row.updated_at)
+
+async def _load_tracking_response(track_no: str, primary: bool = False) -> Optional[TrackingEntry]:
+    async with read_session_scope(track_no, primary=primary) as db:
+        result = await db.execute(select(*TRACKING_SPEC.columns).where(Shipment.track_no == track_no))
+        shipment = result.first()
+
+    if not shipment:
+        return None
+    return _tracking_entry(shipment)
+
+# statement אחד לכל גודל רשימה: track_no = ANY($1::VARCHAR[]) על האינדקס הייחודי
+TRACKING_BATCH_QUERY = select(*TRACKING_SPEC.columns).where(
+    Shipment.track_no == any_(bindparam("track_nos", type_=ARRAY(String)))
+)
+
+async def _load_tracking_responses(track_nos: List[str], primary: bool = False) -> Dict[str, TrackingEntry]:
+    async with read_session_scope(*track_nos, primary=primary) as db:
+        result = await db.execute(TRACKING_BATCH_QUERY, {"track_nos": track_nos})
+        return {row.track_no: _tracking_entry(row) for row in result}
+
+async def _tracking_not_modified(request: Request, track_no: str) -> Optional[Response]:
+    """
+    Cache miss with a conditional header: compare against updated_at alone
+    instead of loading and serializing the shipment
+    """
+    async with read_session_scope(track_no, primary=tracking_cache.fill_from_primary(track_no)) as db:
+        row = (await db.execute(
+            select(Shipment.updated_at).where(Shipment.track_no == track_no)
+        )).first()
+    if row is None:
+        return None
+    etag = _tracking_etag(track_no, row.updated_at)
+    if is_not_modified(request, etag, row.updated_at):
+        return not_modified(etag, row.updated_at)
+    return None
+
+# statements של נתיבי הקריאה החמים, מוכנים מראש בכל חיבור של ה-read pool
+@warmup.primer(read_engine)
+async def _prime_hot_queries(db: AsyncSession):
+    await db.execute(select(*TRACKING_SPEC.columns).where(Shipment.track_no == WARMUP_KEY))
+    await db.execute(TRACKING_BATCH_QUERY, {"track_nos": [WARMUP_KEY]})
+    await db.execute(select(Shipment.updated_at).where(Shipment.track_no == WARMUP_KEY))
+    await _customer_list_version(db, WARMUP_KEY, [])
+    await fetch_updated_desc_page(
+        db, CUSTOMER_SHIPMENT_SPEC.query_columns(Shipment.id), [Shipment.customer_id == WARMUP_KEY], None, 50
+    )
+
 @router.get("/shipments/track/{track_no}")
-async def get_shipment_by_tracking(
+async def get_shipment_by_tracking(track_no: str, request: Request):
+    """
+    חיפוש משלוח לפי מספר מעקב
+    """
+    conditional = "if-none-match" in request.headers or "if-modified-since" in request.headers
+    try:
+        # במקרה של hit לא נפתח session מול הדאטאבייס בכלל
+        found, entry = tracking_cache.peek(track_no)
+        if not found:
+            if conditional:
+                response = await _tracking_not_modified(request, track_no)
+                if response is not None:
+                    return response
+            entry = await tracking_cache.get(track_no, _load_tracking_response)
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching shipment {track_no}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    if conditional and is_not_modified(request, entry.etag, entry.last_modified):
+        return not_modified(entry.etag, entry.last_modified)
+    return Response(
+        content=entry.body,
+        media_type="application/json",
+        headers=validator_headers(entry.etag, entry.last_modified),
+    )
+
+class TrackBatchRequest(BaseModel):
+    track_nos: List[str]
+
+@router.post("/shipments/track:batch")
+async def get_shipments_by_tracking_batch(payload: TrackBatchRequest):
+    """
+    חיפוש מרוכז של עד 1000 מספרי מעקב - cache קודם, ואז שאילתה אחת לכל החסרים
+
+    results maps every requested track_no to the same object that
+    /shipments/track/{track_no} returns, or null when it does not exist.
+    """
+    track_nos = list(dict.fromkeys(payload.track_nos))
+    if len(track_nos) > MAX_TRACK_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_TRACK_BATCH_SIZE} tracking numbers")
+
+    try:
+        entries = await tracking_cache.get_many(track_nos, _load_tracking_responses)
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching {len(track_nos)} shipments by tracking number: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    # גופי ה-JSON מה-cache משורשרים כמו שהם, בלי פענוח וקידוד מחדש
+    not_found = [track_no for track_no in track_nos if entries[track_no] is None]
+    results = b",".join(
+        orjson.dumps(track_no) + b":" + (entries[track_no].body if entries[track_no] else b"null")
+        for track_no in track_nos
+    )
+    body = (
+        b'{"results":{' + results + b'},"found":' + str(len(track_nos) - len(not_found)).encode()
+        + b',"not_found":' + orjson.dumps(not_found) + b"}"
+    )
+    return Response(content=body, media_type="application/json")
+
+@router.get("/shipments/track/{track_no}/events")
+async def get_shipment_events(
     track_no: str,
-    db: AsyncSession = Depends(get_db)
+    after: Optional[List[Any]] = Depends(keyset_cursor),
+    db: AsyncSession = Depends(get_read_db),
+    limit: int = Query(50, ge=1, le=200, description="Maximum number of events"),
 ):
     """
-    חיפוש משלוח לפי מספר מעקב
+    היסטוריית סטטוסים של משלוח, מהחדש לישן
     """
     try:
-        result = await db.execute(select(Shipment).where(Shipment.track_no == track_no))
-        shipment = result.scalars().first()
-        
-        if not shipment:
-            raise HTTPException(status_code=404, detail="Shipment not found")
-        
-        return {
-            "track_no": shipment.track_no,
-            "customer_id": shipment.customer_id,
-            "invoice_number": shipment.invoice_number,
-            "status_code": shipment.status_code,
-            "status_desc": shipment.status_desc,
-            "exception_code": shipment.exception_code,
-            "exception_desc": shipment.exception_desc,
-            "estimated_delivery": shipment.estimated_delivery,
-            "delivered_time": shipment.delivered_time,
-            "received_by": shipment.received_by,
-            "service_code": shipment.service_code,
-            "current_location": shipment.current_location,
-            "last_scan_location": shipment.last_scan_location,
-            "delivery_attempt_count": shipment.delivery_attempt_count,
-            "created_at": shipment.created_at.isoformat() if shipment.created_at else None,
-            "updated_at": shipment.updated_at.isoformat() if shipment.updated_at else None
-        }
+        query = (
+            select(*EVENT_SPEC.query_columns(ShipmentEvent.id))
+            .where(ShipmentEvent.track_no == track_no)
+            .order_by(ShipmentEvent.received_at.desc(), ShipmentEvent.id.desc())
+            .limit(limit + 1)
+        )
+        if after:
+            query = query.where(
+                tuple_(ShipmentEvent.received_at, ShipmentEvent.id)
+                < tuple_(parse_cursor_datetime(after[0]), after[1])
+            )
+        events = (await db.execute(query)).all()
+
+        next_cursor = None
+        if len(events) > limit:
+            events = events[:limit]
+            next_cursor = encode_cursor(events[-1].received_at, events[-1].id)
+
+        return ORJSONResponse({
+            "track_no": track_no,
+            "next_cursor": next_cursor,
+            "events": EVENT_SPEC.rows(events),
+        })
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching shipment {track_no}: {e}")
+        logger.error(f"Error fetching events for shipment {track_no}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/export")
+async def export_shipments(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    customer_id: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None, description="created_at >= date_from"),
+    date_to: Optional[date] = Query(None, description="created_at < date_to + 1 day"),
+    gzip: bool = Query(False, description="gzip the response body (Content-Encoding: gzip)")
+):
+    """
+    ייצוא משלוחים בהזרמה (NDJSON/CSV) מ-server-side cursor - זיכרון קבוע לכל גודל
+
+    Uses the same field mapping as /shipments/track/{track_no}.
+    """
+    if not read_db_health.available():
+        raise DatabaseUnavailable(read_db_health.last_error or "database circuit is open")
+
+    filters = []
+    if customer_id:
+        filters.append(Shipment.customer_id == customer_id)
+    if date_from:
+        filters.append(Shipment.created_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        filters.append(Shipment.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+
+    query = (
+        select(*TRACKING_SPEC.columns)
+        .where(*filters)
+        .order_by(Shipment.id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+
+    async def chunks():
+        if format == "csv":
+            yield TRACKING_SPEC.csv_header()
+
+        exported = 0
+        async with read_session_scope() as db:
+            result = await db.stream(query)
+            async for partition in result.partitions():
+                if format == "csv":
+                    yield TRACKING_SPEC.csv(partition)
+                else:
+                    yield TRACKING_SPEC.ndjson(partition)
+                exported += len(partition)
+        logger.info(f"Exported {exported} shipments as {format}")
+
+    async def gzipped(source):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        async for chunk in source:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"shipments.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    body = chunks()
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = gzipped(body)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+@router.get("/statuses")
+async def get_statuses(db: AsyncSession = Depends(get_read_db)):
+    """
+    מילון הסטטוסים: status_code עם תוויות בעברית ובאנגלית
+    """
+    result = await db.execute(
+        select(ShipmentStatus.status_code, ShipmentStatus.label_he, ShipmentStatus.label_en)
+        .order_by(ShipmentStatus.status_code)
+    )
+    return {"statuses": [dict(row._mapping) for row in result]}
+
+@router.get("/cache/stats")
+async def tracking_cache_stats():
+    """
+    סטטיסטיקות cache המעקב: hit/miss ratio
+    """
+    return tracking_cache.stats()
+
 @router.get("/health")
 async def health_check():
     """
@@ -109,6 +364,11 @@ async def health_check():
         "endpoints": {
             "customer_shipments": "/api/v1/shipments/customer/{customer_id}",
             "track_shipment": "/api/v1/shipments/track/{track_no}",
-            "webhook": "/webhook"
+            "track_shipments_batch": "/api/v1/shipments/track:batch",
+            "shipment_events": "/api/v1/shipments/track/{track_no}/events",
+            "export": "/api/v1/export",
+            "statuses": "/api/v1/statuses",
+            "webhook": "/webhook",
+            "webhook_batch": "/webhook/batch"
         }
     }
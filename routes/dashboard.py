@@ -1,129 +1,241 @@
-from fastapi import APIRouter, Request, Depends
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, text
 from sqlalchemy.future import select
+import asyncio
 import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-from database.session import get_db
+from database.health import DatabaseUnavailable
+from database.session import get_db, get_read_db, query_log, read_session_scope
 from models.shipment import Shipment
+from services import change_events
+from services.broadcaster import DASHBOARD_COLUMNS, broadcaster
+from services.pagination import decode_cursor, fetch_updated_desc_page
+from services.warmup import warmup
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 logger = logging.getLogger(__name__)
 
+@warmup.step
+def _load_templates():
+    # הקומפילציה של התבנית קורית בעלייה ולא בבקשה הראשונה לדשבורד
+    templates.get_template("dashboard.html")
+
+DASHBOARD_PAGE_SIZE = 50
+STATUS_BREAKDOWN_LIMIT = 50
+STREAM_HEARTBEAT_SECONDS = 15
+
+def _parse_filters(request: Request) -> Dict[str, Any]:
+    """
+    פילטרים מה-URL. שדות ריקים מהטופס נחשבים כלא קיימים.
+    """
+    params = request.query_params
+    filters: Dict[str, Any] = {}
+    for name in ("customer_id", "status_code", "has_exception", "date_from", "date_to"):
+        value = (params.get(name) or "").strip()
+        if not value:
+            continue
+        try:
+            if name == "status_code":
+                filters[name] = int(value)
+            elif name == "has_exception":
+                filters[name] = value.lower() in ("1", "true", "yes", "on")
+            elif name in ("date_from", "date_to"):
+                filters[name] = date.fromisoformat(value)
+            else:
+                filters[name] = value
+        except ValueError:
+            raise ValueError(f"Invalid value for {name}: {value}")
+    return filters
+
+def _filter_clauses(filters: Dict[str, Any]) -> List[Any]:
+    clauses = []
+    if "customer_id" in filters:
+        clauses.append(Shipment.customer_id == filters["customer_id"])
+    if "status_code" in filters:
+        clauses.append(Shipment.status_code == filters["status_code"])
+    if "has_exception" in filters:
+        if filters["has_exception"]:
+            clauses.append(Shipment.exception_code.is_not(None))
+        else:
+            clauses.append(Shipment.exception_code.is_(None))
+    if "date_from" in filters:
+        clauses.append(Shipment.updated_at >= datetime.combine(filters["date_from"], time.min))
+    if "date_to" in filters:
+        clauses.append(Shipment.updated_at < datetime.combine(filters["date_to"] + timedelta(days=1), time.min))
+    return clauses
+
 @router.get("/")
-async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
+async def dashboard(
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(DASHBOARD_PAGE_SIZE, ge=1, le=200)
+):
+    context = {"request": request, "shipments": [], "filters": {}, "next_url": None}
     try:
         logger.info("Loading dashboard...")
-        
-        # Test database connection with retry
-        retry_count = 3
-        for attempt in range(retry_count):
-            try:
-                await db.execute(select(1))
-                logger.info("Database connection test successful")
-                break
-            except Exception as e:
-                logger.warning(f"Database connection attempt {attempt + 1} failed: {e}")
-                if attempt == retry_count - 1:
-                    logger.error(f"All database connection attempts failed")
-                    return templates.TemplateResponse("dashboard.html", {
-                        "request": request, 
-                        "shipments": [],
-                        "error": f"Database connection failed after {retry_count} attempts: {str(e)}"
-                    })
-                # Wait a bit before retry
-                import asyncio
-                await asyncio.sleep(0.5)
-        
-        # Try to get shipments with multiple fallback queries
-        shipments = []
-        
-        # Try complex query first
-        try:
-            result = await db.execute(
-                select(Shipment)
-                .order_by(
-                    Shipment.updated_at.desc().nulls_last(), 
-                    Shipment.created_at.desc().nulls_last(),
-                    Shipment.id.desc()
-                )
-                .limit(50)
+        context["filters"] = filters = _parse_filters(request)
+        after = decode_cursor(cursor, 2)
+
+        # רק העמודות שמוצגות בטבלה, לפי עמוד (keyset)
+        async with read_session_scope() as db:
+            shipments, next_cursor = await fetch_updated_desc_page(
+                db, [*DASHBOARD_COLUMNS, Shipment.id], _filter_clauses(filters), after, limit
             )
-            shipments = result.scalars().all()
-            logger.info("Complex query succeeded")
-        except Exception as e:
-            logger.warning(f"Complex query failed: {e}")
-            
-            # Try simple query
-            try:
-                result = await db.execute(select(Shipment).order_by(Shipment.id.desc()).limit(50))
-                shipments = result.scalars().all()
-                logger.info("Simple query succeeded")
-            except Exception as e2:
-                logger.warning(f"Simple query failed: {e2}")
-                
-                # Try most basic query
-                try:
-                    result = await db.execute(select(Shipment))
-                    shipments = result.scalars().all()
-                    logger.info("Basic query succeeded")
-                except Exception as e3:
-                    logger.error(f"All queries failed: {e3}")
-                    return templates.TemplateResponse("dashboard.html", {
-                        "request": request, 
-                        "shipments": [],
-                        "error": f"Query failed: {str(e3)}"
-                    })
-        
+
         logger.info(f"Found {len(shipments)} shipments")
-        
-        # Log some sample data
-        if shipments:
-            logger.info(f"Sample shipment: {shipments[0].track_no}")
-            for i, ship in enumerate(shipments[:3]):
-                logger.info(f"Shipment {i+1}: {ship.track_no} - {ship.status_desc}")
-        else:
-            logger.warning("No shipments found in database")
-            
-        return templates.TemplateResponse("dashboard.html", {"request": request, "shipments": shipments})
+        context["shipments"] = shipments
+        if next_cursor:
+            context["next_url"] = str(request.url.include_query_params(cursor=next_cursor))
+        return templates.TemplateResponse(request, "dashboard.html", context)
+    except DatabaseUnavailable as e:
+        # ה-health monitor כבר יודע שהדאטאבייס למטה - לא מנסים שוב בכל רענון
+        logger.warning(f"Database unavailable, skipping queries: {e}")
+        context["error"] = f"Database connection unavailable: {str(e)}"
+        return templates.TemplateResponse(request, "dashboard.html", context)
+    except (ValueError, HTTPException) as e:
+        context["error"] = f"Invalid filter: {getattr(e, 'detail', e)}"
+        return templates.TemplateResponse(request, "dashboard.html", context)
     except Exception as e:
         logger.error(f"Error loading dashboard: {e}")
-        return templates.TemplateResponse("dashboard.html", {
-            "request": request, 
-            "shipments": [],
-            "error": f"Dashboard error: {str(e)}"
-        })
+        context["error"] = f"Dashboard error: {str(e)}"
+        return templates.TemplateResponse(request, "dashboard.html", context)
+
+@router.get("/dashboard/stream")
+async def dashboard_stream(request: Request):
+    """
+    Server-Sent Events: שורות משלוח שהשתנו נדחפות לדשבורד בלי רענון
+    """
+    queue = broadcaster.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield f"event: shipments\ndata: {message}\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/dashboard/stream/stats")
+async def dashboard_stream_stats():
+    return broadcaster.stats()
+
+@router.get("/debug/slow-queries")
+async def slow_queries():
+    """
+    השאילתות האיטיות האחרונות, כולל תוכנית EXPLAIN לאלו שנדגמו
+    """
+    return {"stats": query_log.stats(), "recent": query_log.recent_entries()}
 
 @router.get("/debug/db-status")
-async def db_status(db: AsyncSession = Depends(get_db)):
+async def db_status(
+    db: AsyncSession = Depends(get_read_db),
+    exact: bool = Query(False, description="Run exact COUNT(*) / GROUP BY instead of planner estimates"),
+    sample: int = Query(10, ge=0, le=50, description="Number of most recent rows to include")
+):
+    """
+    סטטיסטיקות טבלה בזיכרון קבוע - הערכות מ-pg_class/pg_stats, גדלים ודגימה חסומה
+    """
     try:
-        # Simple count and select all
-        result = await db.execute(select(Shipment))
-        all_shipments = result.scalars().all()
-        count = len(all_shipments)
-        
-        # Get sample data with more details
-        sample_data = []
-        if all_shipments:
-            for shipment in all_shipments[:10]:  # First 10
-                sample_data.append({
-                    "id": shipment.id,
-                    "track_no": shipment.track_no,
-                    "customer_id": shipment.customer_id,
-                    "status_desc": shipment.status_desc,
-                    "created_at": str(shipment.created_at) if shipment.created_at else None,
-                    "updated_at": str(shipment.updated_at) if shipment.updated_at else None
-                })
-        
+        estimated = (await db.execute(text(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = 'shipments'::regclass"
+        ))).scalar()
+        # reltuples = -1 until the table has been vacuumed/analyzed
+        estimated = estimated if estimated is not None and estimated >= 0 else None
+
+        exact_count = None
+        if exact:
+            exact_count = (await db.execute(select(func.count()).select_from(Shipment))).scalar()
+            status_rows = (await db.execute(
+                select(Shipment.status_code, func.count().label("count"))
+                .group_by(Shipment.status_code)
+                .order_by(func.count().desc())
+                .limit(STATUS_BREAKDOWN_LIMIT)
+            )).all()
+            by_status = [{"status_code": r.status_code, "count": r.count} for r in status_rows]
+        else:
+            # התפלגות מוערכת מהסטטיסטיקות של ANALYZE
+            stats_row = (await db.execute(text(
+                "SELECT most_common_vals::text::int[] AS vals, most_common_freqs AS freqs "
+                "FROM pg_stats WHERE tablename = 'shipments' AND attname = 'status_code'"
+            ))).first()
+            by_status = []
+            if stats_row and stats_row.vals and estimated:
+                by_status = [
+                    {"status_code": code, "estimated_count": round(freq * estimated)}
+                    for code, freq in zip(stats_row.vals, stats_row.freqs)
+                ][:STATUS_BREAKDOWN_LIMIT]
+
+        sizes = (await db.execute(text(
+            "SELECT pg_relation_size('shipments') AS table_bytes, "
+            "pg_indexes_size('shipments') AS indexes_bytes, "
+            "pg_total_relation_size('shipments') AS total_bytes, "
+            "(SELECT coalesce(sum(pg_total_relation_size(relid)), 0) "
+            " FROM pg_partition_tree('shipment_events')) AS events_total_bytes"
+        ))).one()
+        indexes = (await db.execute(text(
+            "SELECT indexrelname AS name, pg_relation_size(indexrelid) AS bytes, idx_scan AS scans "
+            "FROM pg_stat_user_indexes WHERE relname = 'shipments' ORDER BY indexrelname"
+        ))).all()
+
+        sample_rows = (await db.execute(
+            select(
+                Shipment.id,
+                Shipment.track_no,
+                Shipment.customer_id,
+                Shipment.status_desc,
+                Shipment.created_at,
+                Shipment.updated_at,
+            ).order_by(Shipment.id.desc()).limit(sample)
+        )).all()
+
         return {
             "database_connection": "OK",
-            "total_shipments": count,
-            "sample_data": sample_data,
-            "note": "All data directly from the Render database"
+            "total_shipments": exact_count if exact else estimated,
+            "estimated_rows": estimated,
+            "exact_rows": exact_count,
+            "by_status": by_status,
+            "sizes": {
+                "table_bytes": sizes.table_bytes,
+                "indexes_bytes": sizes.indexes_bytes,
+                "total_bytes": sizes.total_bytes,
+                "events_total_bytes": int(sizes.events_total_bytes),
+                "indexes": [dict(r._mapping) for r in indexes],
+            },
+            "sample_data": [
+                {
+                    "id": r.id,
+                    "track_no": r.track_no,
+                    "customer_id": r.customer_id,
+                    "status_desc": r.status_desc,
+                    "created_at": str(r.created_at) if r.created_at else None,
+                    "updated_at": str(r.updated_at) if r.updated_at else None
+                }
+                for r in sample_rows
+            ],
         }
     except Exception as e:
         return {
@@ -178,7 +290,7 @@ async def add_test_data_route(db: AsyncSession = Depends(get_db)):
         for shipment in test_shipments:
             db.add(shipment)
         
-        await db.commit()
+        await change_events.commit_and_publish(db, [s.track_no for s in test_shipments])
         
         return {
             "message": f"Added {len(test_shipments)} test shipments to database",
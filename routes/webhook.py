@@ -1,98 +1,133 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from datetime import datetime
 import logging
 
-from database.session import get_db
+from database.health import DatabaseUnavailable
+from database.session import get_db, session_scope
 from models.shipment import Shipment
+from services import change_events
+from services.ingest_queue import WRITE_BEHIND_ENABLED, ingest_queue
+from services.idempotency import claim_keys, idempotency_key
+from services.metrics import record_webhook_outcome, record_webhook_results
+from services.shipment_upsert import (
+    parse_batch_body,
+    upsert_payloads,
+    write_row,
+)
+from services.webhook_payload import decode_webhook
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_SIZE = 5000
+
 @router.post("/webhook")
-async def receive_webhook(request: Request, db: AsyncSession = Depends(get_db)):
+async def receive_webhook(request: Request):
+    # פענוח ישיר מה-bytes לאובייקט מוקלד; payload לא תקין מחזיר 422 עם השדה שנכשל
     try:
-        data = await request.json()
-        logger.info(f"Received webhook data: {data}")
-        
-        now = datetime.utcnow()
-        track_no = data.get("trackNo")
-        
-        if not track_no:
-            raise HTTPException(status_code=400, detail="trackNo is required")
-
-        result = await db.execute(select(Shipment).where(Shipment.track_no == track_no))
-        shipment = result.scalars().first()
-
-        if shipment:
-            # עדכון משלוח קיים
-            shipment.status_code = int(data.get("statusCode", 0))
-            shipment.status_desc = data.get("statusDescHeb")
-            shipment.exception_code = data.get("exceptionCode")
-            shipment.exception_desc = data.get("exceptionDescHeb")
-            shipment.estimated_delivery = data.get("estimateDelivery")
-            shipment.delivered_time = data.get("deliveredTime")
-            shipment.received_by = data.get("receivedBy")
-            
-            # UPS API additional fields
-            shipment.service_code = data.get("serviceCode")
-            shipment.current_location = data.get("currentLocation")
-            shipment.last_scan_location = data.get("lastScanLocation")
-            shipment.last_scan_time = data.get("lastScanTime")
-            shipment.delivery_attempt_count = data.get("deliveryAttemptCount", 0)
-            shipment.delivery_instructions = data.get("deliveryInstructions")
-            shipment.signature_required = data.get("signatureRequired", False)
-            
-            shipment.updated_at = now
-            logger.info(f"Updated existing shipment: {track_no}")
-        else:
-            shipment = Shipment(
-                track_no=track_no,
-                customer_id=data.get("ref1"),
-                invoice_number=data.get("ref2"),
-                status_code=int(data.get("statusCode", 0)),
-                status_desc=data.get("statusDescHeb"),
-                exception_code=data.get("exceptionCode"),
-                exception_desc=data.get("exceptionDescHeb"),
-                estimated_delivery=data.get("estimateDelivery"),
-                delivered_time=data.get("deliveredTime"),
-                received_by=data.get("receivedBy"),
-                
-                # UPS API additional fields
-                service_code=data.get("serviceCode"),
-                package_weight=data.get("packageWeight"),
-                package_dimensions=data.get("packageDimensions"),
-                shipper_name=data.get("shipperName"),
-                shipper_address=data.get("shipperAddress"),
-                recipient_name=data.get("recipientName"),
-                recipient_address=data.get("recipientAddress"),
-                current_location=data.get("currentLocation"),
-                last_scan_location=data.get("lastScanLocation"),
-                last_scan_time=data.get("lastScanTime"),
-                delivery_attempt_count=data.get("deliveryAttemptCount", 0),
-                delivery_instructions=data.get("deliveryInstructions"),
-                signature_required=data.get("signatureRequired", False),
-                ref1=data.get("ref1"),
-                ref2=data.get("ref2"),
-                ref3=data.get("ref3"),
-                shipping_cost=data.get("shippingCost"),
-                insurance_value=data.get("insuranceValue"),
-                
-                created_at=now,
-                updated_at=now,
+        payload = decode_webhook(await request.body())
+    except RequestValidationError:
+        record_webhook_outcome("sync", "invalid")
+        raise
+    key = idempotency_key(request)
+
+    try:
+        logger.info(f"Received webhook for {payload.track_no} (status {payload.status_code})")
+        row = payload.to_row(datetime.utcnow())
+
+        if WRITE_BEHIND_ENABLED:
+            # מצב write-behind: האירוע נכתב ברקע, התשובה חוזרת מיד
+            if not ingest_queue.enqueue(payload, key):
+                record_webhook_outcome("write_behind", "rejected")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Ingest queue is full, retry later",
+                    headers={"Retry-After": "1"},
+                )
+            record_webhook_outcome("write_behind", "queued")
+            return JSONResponse(
+                status_code=202,
+                content={"message": "Shipment update accepted", "track_no": row["track_no"]},
             )
-            db.add(shipment)
-            logger.info(f"Created new shipment: {track_no}")
 
-        await db.commit()
+        track_no = row["track_no"]
+        # upsert + היסטוריה + NOTIFY בפקודה אחת - סבב אחד מול הדאטאבייס
+        async with session_scope() as db:
+            if key and not await claim_keys(db, [(key, track_no)]):
+                record_webhook_outcome("sync", "duplicate")
+                logger.info(f"Idempotency-Key replay for {track_no}, nothing written")
+                return {"message": "Duplicate delivery ignored", "track_no": track_no, "duplicate": True}
+
+            # אין שורה כשה-status_hash זהה לשמור - האירוע כבר נכתב
+            written = await write_row(db, row)
+            # ה-NOTIFY יוצא עם ה-commit, כך ש-workers אחרים מעדכנים את ה-cache שלהם
+            await db.commit()
+        if written is not None:
+            change_events.publish([track_no])
+
+        if written is None:
+            record_webhook_outcome("sync", "unchanged")
+            return {"message": "Shipment status unchanged", "track_no": track_no, "changed": False}
+
+        record_webhook_outcome("sync", "created" if written.inserted else "updated")
+        logger.info(f"{'Created new' if written.inserted else 'Updated existing'} shipment: {track_no}")
         return {"message": "Shipment saved or updated successfully", "track_no": track_no}
-    
+
+    except (HTTPException, DatabaseUnavailable):
+        raise
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/webhook/batch")
+async def receive_webhook_batch(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    קבלת batch של webhooks (מערך JSON או NDJSON) וכתיבה בטרנזקציה אחת
+    """
+    try:
+        items = parse_batch_body(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} items")
+
+    # Idempotency-Key על batch מכסה את כל הגוף
+    key = idempotency_key(request)
+    try:
+        if key and not await claim_keys(db, [(key, None)]):
+            record_webhook_outcome("batch", "duplicate", len(items))
+            return {"received": len(items), "written": 0, "errors": 0, "duplicate": True, "results": []}
+
+        results = await upsert_payloads(db, items)
+        await change_events.commit_and_publish(
+            db, [r["track_no"] for r in results if r.get("status") in ("created", "updated")]
+        )
+        record_webhook_results("batch", results)
+    except Exception as e:
+        logger.error(f"Error processing webhook batch: {e}")
         await db.rollback()
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    return {
+        "received": len(items),
+        "written": sum(1 for r in results if r.get("status") in ("created", "updated")),
+        "unchanged": sum(1 for r in results if r.get("status") == "unchanged"),
+        "errors": sum(1 for r in results if r.get("status") == "error"),
+        "results": results,
+    }
+
+@router.get("/webhook/queue-stats")
+async def webhook_queue_stats():
+    """
+    מוני תור ה-write-behind: עומק, אירועים שאוחדו ו-lag
+    """
+    return ingest_queue.stats()
+
 @router.post("/test-webhook")
 async def test_webhook(db: AsyncSession = Depends(get_db)):
     """Test endpoint to create a sample shipment"""
@@ -135,7 +170,7 @@ async def test_webhook(db: AsyncSession = Depends(get_db)):
             updated_at=now,
         )
         db.add(shipment)
-        await db.commit()
+        await change_events.commit_and_publish(db, [shipment.track_no])
         
         return {"message": "Test shipment created successfully", "track_no": test_data["trackNo"]}
     
@@ -0,0 +1,146 @@
+"""
+In-process broadcaster for the live dashboard (Server-Sent Events)
+
+Committed writes mark track_nos as dirty. Once per coalescing window the
+broadcaster loads the changed rows with a single query and fans the same
+pre-serialized message out to every connected browser, so the number of
+clients never changes the database load.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy.future import select
+
+from database.health import DatabaseUnavailable
+from database.session import session_scope
+from models.shipment import Shipment
+from services import change_events
+
+logger = logging.getLogger(__name__)
+
+COALESCE_SECONDS = float(os.getenv("DASHBOARD_STREAM_COALESCE_SECONDS", "1.0"))
+CLIENT_QUEUE_SIZE = int(os.getenv("DASHBOARD_STREAM_CLIENT_QUEUE", "50"))
+
+# העמודות שמוצגות בטבלת הדשבורד
+DASHBOARD_COLUMNS = [
+    Shipment.track_no,
+    Shipment.customer_id,
+    Shipment.invoice_number,
+    Shipment.status_code,
+    Shipment.status_desc,
+    Shipment.exception_code,
+    Shipment.exception_desc,
+    Shipment.estimated_delivery,
+    Shipment.delivered_time,
+    Shipment.received_by,
+    Shipment.updated_at,
+]
+
+
+def dashboard_row(row) -> Dict[str, Any]:
+    data = dict(row._mapping)
+    data["updated_at"] = row.updated_at.strftime("%Y-%m-%d %H:%M") if row.updated_at else ""
+    return data
+
+
+class DashboardBroadcaster:
+    def __init__(self, coalesce_seconds: float, client_queue_size: int):
+        self.coalesce_seconds = coalesce_seconds
+        self.client_queue_size = client_queue_size
+        self._clients: Set[asyncio.Queue] = set()
+        self._pending: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.messages_sent = 0
+        self.rows_pushed = 0
+        self.dropped_clients = 0
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="dashboard-broadcaster")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # None מסיים את ה-stream של כל לקוח
+        for queue in list(self._clients):
+            self._offer(queue, None)
+
+    def notify(self, track_nos: List[str]):
+        if not self._clients or self._wakeup is None:
+            return
+        self._pending.update(track_nos)
+        self._wakeup.set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.client_queue_size)
+        self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._clients.discard(queue)
+
+    def _offer(self, queue: asyncio.Queue, message: Optional[str]):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # דפדפן איטי - מנתקים אותו (EventSource יתחבר מחדש)
+            self._clients.discard(queue)
+            self.dropped_clients += 1
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # עדכונים מאותה שנייה נשלחים כהודעה אחת
+            await asyncio.sleep(self.coalesce_seconds)
+            self._wakeup.clear()
+            track_nos, self._pending = self._pending, set()
+            if not track_nos or not self._clients:
+                continue
+            try:
+                rows = await self._load(track_nos)
+            except DatabaseUnavailable:
+                # ננסה שוב בחלון הבא
+                self._pending.update(track_nos)
+                self._wakeup.set()
+                continue
+            except Exception as e:
+                logger.error(f"Dashboard broadcaster failed to load {len(track_nos)} rows: {e}")
+                continue
+
+            message = json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+            for queue in list(self._clients):
+                self._offer(queue, message)
+            self.messages_sent += 1
+            self.rows_pushed += len(rows)
+
+    async def _load(self, track_nos: Set[str]) -> List[Dict[str, Any]]:
+        async with session_scope() as db:
+            result = await db.execute(
+                select(*DASHBOARD_COLUMNS).where(Shipment.track_no.in_(track_nos))
+            )
+            return [dashboard_row(row) for row in result]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "pending": len(self._pending),
+            "messages_sent": self.messages_sent,
+            "rows_pushed": self.rows_pushed,
+            "dropped_clients": self.dropped_clients,
+        }
+
+
+broadcaster = DashboardBroadcaster(COALESCE_SECONDS, CLIENT_QUEUE_SIZE)
+change_events.register(broadcaster.notify)
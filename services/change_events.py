@@ -0,0 +1,117 @@
+"""
+Notification of committed shipment writes
+
+Writers call commit_and_publish() (or publish() after their own commit);
+caches and other subscribers register a listener that receives the changed
+track_nos. Local listeners run right after the commit. Other worker
+processes are reached through a Postgres NOTIFY sent inside the write
+transaction, which services.change_listener receives over LISTEN.
+"""
+import logging
+import os
+import uuid
+from typing import Callable, Iterable, List
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_ENABLED = os.getenv("CHANGE_EVENTS_NOTIFY", "true").lower() in ("1", "true", "yes")
+CHANNEL = "shipment_changes"
+# NOTIFY payloads are capped at 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+# מזהה התהליך - ה-listener מדלג על הודעות שהתהליך עצמו שלח
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+NOTIFY_STATEMENT = text("SELECT pg_notify(:channel, :payload)")
+
+_listeners: List[Callable[[List[str]], None]] = []
+_reset_listeners: List[Callable[[], None]] = []
+
+
+def register(listener: Callable[[List[str]], None]):
+    _listeners.append(listener)
+    return listener
+
+
+def register_reset(listener: Callable[[], None]):
+    """
+    Called when notifications may have been missed (LISTEN reconnect);
+    caches drop everything instead of serving stale entries
+    """
+    _reset_listeners.append(listener)
+    return listener
+
+
+def _unique(track_nos: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(t for t in track_nos if t))
+
+
+def publish(track_nos: Iterable[str]):
+    track_nos = _unique(track_nos)
+    if not track_nos:
+        return
+    for listener in _listeners:
+        try:
+            listener(track_nos)
+        except Exception as e:
+            logger.error(f"Change listener {listener!r} failed: {e}")
+
+
+def reset():
+    for listener in _reset_listeners:
+        try:
+            listener()
+        except Exception as e:
+            logger.error(f"Change reset listener {listener!r} failed: {e}")
+
+
+def encode_payloads(track_nos: List[str]) -> List[str]:
+    """
+    {"w": worker, "t": [...]} messages, as few as fit under the NOTIFY limit
+    """
+    payloads = []
+    prefix = orjson.dumps({"w": WORKER_ID, "t": []})[:-2]
+    chunk: List[bytes] = []
+    size = len(prefix) + 2
+    for track_no in track_nos:
+        encoded = orjson.dumps(track_no)
+        if chunk and size + len(encoded) + 1 > MAX_PAYLOAD_BYTES:
+            payloads.append((prefix + b",".join(chunk) + b"]}").decode())
+            chunk, size = [], len(prefix) + 2
+        chunk.append(encoded)
+        size += len(encoded) + 1
+    if chunk:
+        payloads.append((prefix + b",".join(chunk) + b"]}").decode())
+    return payloads
+
+
+def decode_payload(payload: str):
+    """
+    (worker_id, track_nos) out of a NOTIFY payload
+    """
+    message = orjson.loads(payload)
+    return message["w"], message["t"]
+
+
+async def notify(db: AsyncSession, track_nos: Iterable[str]):
+    """
+    NOTIFY inside the caller's transaction - delivered only if it commits
+    """
+    if not NOTIFY_ENABLED:
+        return
+    for payload in encode_payloads(_unique(track_nos)):
+        await db.execute(NOTIFY_STATEMENT, {"channel": CHANNEL, "payload": payload})
+
+
+async def commit_and_publish(db: AsyncSession, track_nos: Iterable[str]):
+    """
+    Commits the write together with its NOTIFY, then tells local listeners
+    """
+    track_nos = _unique(track_nos)
+    if track_nos:
+        await notify(db, track_nos)
+    await db.commit()
+    publish(track_nos)
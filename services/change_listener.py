@@ -0,0 +1,166 @@
+"""
+Cross-process change fan-out over Postgres LISTEN
+
+Each worker keeps one dedicated asyncpg connection (outside the SQLAlchemy
+pools) listening on change_events.CHANNEL. Notifications from other
+workers are coalesced for a short window and handed to the local
+subscribers (tracking cache, dashboard broadcaster, read-your-writes) as a
+single publish, so a burst of webhook commits costs each worker a few
+dispatches instead of one per commit. After a reconnect, notifications
+sent while the connection was down are lost, so local caches are reset.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Set
+
+import asyncpg
+
+from database.session import asyncpg_dsn, engine
+from services import change_events
+
+logger = logging.getLogger(__name__)
+
+COALESCE_SECONDS = float(os.getenv("CHANGE_LISTENER_COALESCE_MS", "50")) / 1000
+RECONNECT_MAX_SECONDS = 30.0
+# LISTEN נשאר פתוח זמן רב - בדיקה תקופתית שהחיבור עדיין חי
+KEEPALIVE_SECONDS = 30.0
+
+
+class ChangeListener:
+    def __init__(self, dsn: str, coalesce_seconds: float):
+        self.dsn = dsn
+        self.coalesce_seconds = coalesce_seconds
+        self._conn: Optional[asyncpg.Connection] = None
+        self._pending: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lost: Optional[asyncio.Event] = None
+        self._tasks = []
+
+        self.connected = False
+        self.reconnects = 0
+        self.notifications = 0
+        self.own_notifications = 0
+        self.dispatches = 0
+        self.track_nos_dispatched = 0
+        self.last_notification_at: Optional[float] = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._connection_loop(), name="change-listener"),
+            asyncio.create_task(self._dispatch_loop(), name="change-listener-dispatch"),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self._close()
+
+    async def _close(self):
+        conn, self._conn = self._conn, None
+        self.connected = False
+        if conn is not None and not conn.is_closed():
+            try:
+                await conn.close(timeout=2)
+            except Exception:
+                conn.terminate()
+
+    def _on_notification(self, connection, pid, channel, payload):
+        self.notifications += 1
+        self.last_notification_at = time.time()
+        try:
+            worker_id, track_nos = change_events.decode_payload(payload)
+        except Exception as e:
+            logger.error(f"Malformed {channel} notification ignored: {e}")
+            return
+        if worker_id == change_events.WORKER_ID:
+            # התהליך הזה כבר עדכן את המנויים המקומיים מיד אחרי ה-commit
+            self.own_notifications += 1
+            return
+        self._pending.update(track_nos)
+        self._wakeup.set()
+
+    def _on_termination(self, connection):
+        self._lost.set()
+
+    async def _connect(self):
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_termination)
+        await conn.add_listener(change_events.CHANNEL, self._on_notification)
+        self._conn = conn
+        self.connected = True
+
+    async def _connection_loop(self):
+        backoff = 0.5
+        first = True
+        while True:
+            try:
+                await self._connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"LISTEN {change_events.CHANNEL} connect failed: {e!r}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+                continue
+
+            backoff = 0.5
+            if not first:
+                # הודעות שנשלחו בזמן הנתק אבדו
+                self.reconnects += 1
+                change_events.reset()
+                logger.warning(f"LISTEN {change_events.CHANNEL} reconnected, local caches reset")
+            first = False
+            self._lost.clear()
+
+            while not self._lost.is_set():
+                try:
+                    await asyncio.wait_for(self._lost.wait(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    try:
+                        await asyncio.wait_for(self._conn.execute("SELECT 1"), KEEPALIVE_SECONDS)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.error(f"LISTEN connection keepalive failed: {e!r}")
+                        break
+            await self._close()
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # כל ההודעות שהגיעו בחלון נמסרות כ-publish אחד
+            await asyncio.sleep(self.coalesce_seconds)
+            self._wakeup.clear()
+            track_nos, self._pending = self._pending, set()
+            if not track_nos:
+                continue
+            change_events.publish(track_nos)
+            self.dispatches += 1
+            self.track_nos_dispatched += len(track_nos)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": change_events.NOTIFY_ENABLED,
+            "worker_id": change_events.WORKER_ID,
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "notifications": self.notifications,
+            "own_notifications": self.own_notifications,
+            "dispatches": self.dispatches,
+            "track_nos_dispatched": self.track_nos_dispatched,
+            "pending": len(self._pending),
+            "last_notification_at": self.last_notification_at,
+        }
+
+
+change_listener = ChangeListener(asyncpg_dsn(engine.url), COALESCE_SECONDS)
@@ -0,0 +1,84 @@
+"""
+Idempotency-Key handling for webhooks
+
+A key is claimed with INSERT ... ON CONFLICT DO NOTHING inside the same
+transaction as the write it guards. If the key is already stored, the
+delivery is a replay and nothing is written. A concurrent delivery with
+the same key waits on the unique index until the first one commits or
+rolls back, so exactly one of them writes.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Set, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.webhook_idempotency_key import WebhookIdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 200
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("WEBHOOK_IDEMPOTENCY_TTL_HOURS", "48"))
+PRUNE_INTERVAL_SECONDS = 60 * 60
+
+CLAIM_STATEMENT = (
+    pg_insert(WebhookIdempotencyKey)
+    .on_conflict_do_nothing(index_elements=[WebhookIdempotencyKey.key])
+    .returning(WebhookIdempotencyKey.key)
+)
+
+
+def idempotency_key(request: Request) -> Optional[str]:
+    """
+    The request's Idempotency-Key header, or None when it is absent
+    """
+    key = request.headers.get(IDEMPOTENCY_KEY_HEADER, "").strip()
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400, detail=f"{IDEMPOTENCY_KEY_HEADER} exceeds {MAX_KEY_LENGTH} characters"
+        )
+    return key
+
+
+async def claim_keys(db: AsyncSession, claims: Iterable[Tuple[str, Optional[str]]]) -> Set[str]:
+    """
+    Stores (key, track_no) pairs; returns the keys that were not seen before.
+    The caller commits together with the guarded write.
+    """
+    now = datetime.utcnow()
+    rows = [{"key": key, "track_no": track_no, "created_at": now} for key, track_no in claims]
+    if not rows:
+        return set()
+    result = await db.execute(CLAIM_STATEMENT, rows)
+    return set(result.scalars().all())
+
+
+async def prune_expired_keys(engine, ttl_hours: float = IDEMPOTENCY_TTL_HOURS) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=ttl_hours)
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            delete(WebhookIdempotencyKey).where(WebhookIdempotencyKey.created_at < cutoff)
+        )
+    return result.rowcount
+
+
+async def idempotency_pruning_loop(engine):
+    """
+    מחיקת מפתחות שפג תוקפם, כדי שהטבלה לא תגדל ללא גבול
+    """
+    while True:
+        try:
+            removed = await prune_expired_keys(engine)
+            if removed:
+                logger.info(f"Pruned {removed} expired webhook idempotency keys")
+        except Exception as e:
+            logger.error(f"Idempotency key pruning failed: {e}")
+        await asyncio.sleep(PRUNE_INTERVAL_SECONDS)
@@ -0,0 +1,219 @@
+"""
+Write-behind ingestion queue for webhooks
+
+When WEBHOOK_WRITE_BEHIND is enabled the webhook only validates the payload
+and enqueues it. A background flusher drains the queue in micro-batches
+(size or time threshold), coalesces events by track_no and writes each batch
+with the set-based upsert.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.session import db_health, session_scope
+from services import change_events
+from services.idempotency import claim_keys
+from services.metrics import record_webhook_outcome, record_webhook_results
+from services.shipment_upsert import upsert_payloads
+from services.webhook_payload import WebhookPayload
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WEBHOOK_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+MAX_QUEUE_DEPTH = int(os.getenv("WEBHOOK_QUEUE_MAX_DEPTH", "10000"))
+FLUSH_BATCH_SIZE = int(os.getenv("WEBHOOK_FLUSH_BATCH_SIZE", "500"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_FLUSH_INTERVAL_MS", "200")) / 1000
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_SECONDS", "20"))
+MAX_RETRY_BACKOFF_SECONDS = 5.0
+# batch שנכשל שוב ושוב (payload שהדאטאבייס דוחה) לא חוסם את התור לנצח
+MAX_FLUSH_ATTEMPTS = int(os.getenv("WEBHOOK_FLUSH_MAX_ATTEMPTS", "5"))
+
+
+class IngestQueue:
+    def __init__(self, max_depth: int, batch_size: int, flush_interval: float):
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._oldest_in_flight: Optional[float] = None
+
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed_events = 0
+        self.flushed_batches = 0
+        self.coalesced = 0
+        self.failed_flushes = 0
+        self.dropped_events = 0
+        self.last_flush_lag_ms = 0.0
+        self.max_flush_lag_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._task = asyncio.create_task(self._run(), name="webhook-write-behind")
+        logger.info(
+            f"Write-behind queue started (depth={self.max_depth}, "
+            f"batch={self.batch_size}, interval={self.flush_interval}s)"
+        )
+
+    def enqueue(self, payload: WebhookPayload, idempotency_key: Optional[str] = None) -> bool:
+        """
+        הכנסת payload לתור. מחזיר False כשהתור מלא (backpressure)
+        """
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait((time.monotonic(), payload, idempotency_key))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def stop(self):
+        """
+        ריקון התור בזמן כיבוי - ממתין עד DRAIN_TIMEOUT_SECONDS לכתיבת כל האירועים
+        """
+        if not self.running:
+            return
+        logger.info(f"Draining write-behind queue ({self._queue.qsize()} pending)...")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error(f"Write-behind drain timed out, {self._queue.qsize()} events not written")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        logger.info("Write-behind queue stopped")
+
+    async def _next_batch(self) -> List[Tuple[float, WebhookPayload, Optional[str]]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            self._oldest_in_flight = batch[0][0]
+            try:
+                await self._write_batch([(payload, key) for _, payload, key in batch])
+            finally:
+                self._oldest_in_flight = None
+                for _ in batch:
+                    self._queue.task_done()
+
+            lag_ms = (time.monotonic() - batch[0][0]) * 1000
+            self.last_flush_lag_ms = lag_ms
+            self.max_flush_lag_ms = max(self.max_flush_lag_ms, lag_ms)
+
+    async def _write_batch(self, items: List[Tuple[WebhookPayload, Optional[str]]]):
+        """
+        Writes the batch with retries; when the batch keeps failing it is
+        written item by item, so that only the items the database keeps
+        rejecting are dropped
+        """
+        if await self._flush_with_retries(items):
+            return
+        if len(items) == 1:
+            # כבר נוסה לבד - אין מה לפצל
+            self._drop(items[0], f"gave up after {MAX_FLUSH_ATTEMPTS} attempts")
+            return
+
+        logger.error(f"Write-behind batch of {len(items)} events gave up, writing items one at a time")
+        for item in items:
+            try:
+                await self._flush([item])
+            except Exception as e:
+                self._drop(item, str(e))
+
+    async def _flush_with_retries(self, items: List[Tuple[WebhookPayload, Optional[str]]]) -> bool:
+        """
+        Up to MAX_FLUSH_ATTEMPTS attempts (waiting on an open circuit does
+        not count); False when every attempt failed
+        """
+        backoff = 0.1
+        attempts = 0
+        while attempts < MAX_FLUSH_ATTEMPTS:
+            if not db_health.available():
+                # המעגל פתוח - ממתינים ל-health monitor במקום להפציץ את הדאטאבייס
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF_SECONDS)
+                continue
+            attempts += 1
+            try:
+                await self._flush(items)
+                return True
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Write-behind flush of {len(items)} events failed (attempt {attempts}): {e}")
+                if attempts < MAX_FLUSH_ATTEMPTS:
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, MAX_RETRY_BACKOFF_SECONDS)
+        return False
+
+    def _drop(self, item: Tuple[WebhookPayload, Optional[str]], reason: str):
+        self.dropped_events += 1
+        record_webhook_outcome("write_behind", "error")
+        logger.error(f"Write-behind dropped event for {item[0].track_no}: {reason}")
+
+    async def _flush(self, items: List[Tuple[WebhookPayload, Optional[str]]]):
+        async with session_scope() as db:
+            # המפתחות נתפסים באותה טרנזקציה - flush שנכשל ישוחרר וינוסה שוב
+            fresh = await claim_keys(db, {key: payload.track_no for payload, key in items if key}.items())
+            payloads = []
+            for payload, key in items:
+                if key is not None:
+                    if key not in fresh:
+                        continue
+                    fresh.discard(key)
+                payloads.append(payload)
+            results = await upsert_payloads(db, payloads)
+            await change_events.commit_and_publish(
+                db, [r["track_no"] for r in results if r.get("status") in ("created", "updated")]
+            )
+        record_webhook_results("write_behind", results)
+        if len(payloads) < len(items):
+            record_webhook_outcome("write_behind", "duplicate", len(items) - len(payloads))
+        self.flushed_events += len(items)
+        self.flushed_batches += 1
+        self.coalesced += sum(1 for r in results if r.get("status") == "merged")
+
+    def stats(self) -> Dict[str, Any]:
+        in_flight_lag = 0.0
+        if self._oldest_in_flight is not None:
+            in_flight_lag = (time.monotonic() - self._oldest_in_flight) * 1000
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushed_events": self.flushed_events,
+            "flushed_batches": self.flushed_batches,
+            "coalesced": self.coalesced,
+            "failed_flushes": self.failed_flushes,
+            "dropped_events": self.dropped_events,
+            "in_flight_lag_ms": round(in_flight_lag, 1),
+            "last_flush_lag_ms": round(self.last_flush_lag_ms, 1),
+            "max_flush_lag_ms": round(self.max_flush_lag_ms, 1),
+        }
+
+
+ingest_queue = IngestQueue(MAX_QUEUE_DEPTH, FLUSH_BATCH_SIZE, FLUSH_INTERVAL_SECONDS)
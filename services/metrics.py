@@ -0,0 +1,260 @@
+"""
+In-process Prometheus metrics
+
+Request latency and status counters per route template, database query
+latency per normalized statement (SQLAlchemy cursor events), pool checkout
+wait and webhook ingest counters. Everything is recorded in memory and
+scraped from /metrics.
+
+With several workers (uvicorn --workers), set PROMETHEUS_MULTIPROC_DIR to
+an empty directory shared by the workers; /metrics then aggregates every
+worker's samples instead of reporting whichever worker served the scrape.
+"""
+import os
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from starlette.responses import Response
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP responses by route template and status code",
+    ["method", "route", "status"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Database statement latency by normalized statement",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent acquiring a pooled connection",
+    buckets=LATENCY_BUCKETS,
+)
+WEBHOOK_EVENTS = Counter(
+    "webhook_events_total",
+    "Webhook events ingested, by path and outcome",
+    ["mode", "outcome"],
+)
+WEBHOOK_WRITES_SAVED_RATIO = Gauge(
+    "webhook_writes_saved_ratio",
+    "Fraction of webhook events acknowledged without a database write "
+    "(unchanged status or Idempotency-Key replay), per worker",
+    multiprocess_mode="liveall",
+)
+
+COLD_START_SECONDS = Gauge(
+    "cold_start_seconds",
+    "Seconds from the start of the app import to each startup phase "
+    "(import, startup, warm, first_response), per worker",
+    ["phase"],
+    multiprocess_mode="liveall",
+)
+
+# תוצאות שנכתבו לדאטאבייס מול תוצאות שנחסכו
+WRITTEN_OUTCOMES = ("created", "updated")
+SAVED_OUTCOMES = ("unchanged", "duplicate")
+_write_totals = {"written": 0, "saved": 0}
+
+
+def _saved_ratio() -> float:
+    total = _write_totals["written"] + _write_totals["saved"]
+    return _write_totals["saved"] / total if total else 0.0
+
+# ה-scope של הבקשה הנוכחית; ה-route נקבע בו רק אחרי ה-routing, לכן נקרא בעצלות
+REQUEST_SCOPE: ContextVar = ContextVar("request_scope", default=None)
+BACKGROUND_ROUTE = "background"
+
+# נתיבים שלא נמצאו מקובצים ל-label אחד ולא label לכל URL
+UNMATCHED_ROUTE = "unmatched"
+STATEMENT_LABEL_LENGTH = 300
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s|\?")
+# (?, ?, ?) ו-VALUES (...), (...) של insertmanyvalues
+_PARAMETER_LIST = re.compile(r"\(\s*\?(?:\s*(?:::\w+(?:\[\])?)?\s*,\s*\?)*(?:\s*::\w+(?:\[\])?)?\s*\)")
+_REPEATED_GROUPS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+# רשימות עמודות ארוכות לא מבדילות בין שאילתות - ה-WHERE/ORDER BY כן
+_SELECT_LIST = re.compile(r"^SELECT (.+?) FROM ", re.IGNORECASE)
+_INSERT_COLUMNS = re.compile(r"^(INSERT INTO \S+) \([^)]*\)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def normalize_statement(statement: str) -> str:
+    """
+    Literals and bind parameters become ?, parameter lists collapse to (...),
+    so one label covers every execution of the same query shape
+    """
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _STRING_LITERAL.sub("?", normalized)
+    normalized = _PARAMETER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PARAMETER_LIST.sub("(...)", normalized)
+    normalized = _REPEATED_GROUPS.sub("(...)", normalized)
+    normalized = _SELECT_LIST.sub("SELECT ... FROM ", normalized, count=1)
+    normalized = _INSERT_COLUMNS.sub(r"\1 (...)", normalized, count=1)
+    if len(normalized) > STATEMENT_LABEL_LENGTH:
+        normalized = normalized[:STATEMENT_LABEL_LENGTH - 3] + "..."
+    return normalized
+
+
+def instrument_engine(engine):
+    """
+    Times every cursor execution on the engine (the sync engine behind AsyncEngine)
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.labels(normalize_statement(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        # after_cursor_execute לא נקרא כשה-statement נכשל
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+# probes לא נחשבים "תשובה ראשונה" - הם לא מה שמשתמש מחכה לו
+PROBE_ROUTES = frozenset({"/ready", "/status", "/metrics", "/health/db", "/health/change-listener"})
+
+
+class StartupTimer:
+    """
+    Cold-start phases measured from the first line of main.py
+    """
+
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+
+    def start(self, started: float):
+        self.started = started
+
+    def mark(self, phase: str):
+        if self.started is None or phase in self.phases:
+            return
+        seconds = time.perf_counter() - self.started
+        self.phases[phase] = seconds
+        COLD_START_SECONDS.labels(phase).set(seconds)
+        print(f"Cold start: {phase} after {seconds * 1000:.0f}ms")
+
+    @property
+    def awaiting_first_response(self) -> bool:
+        return self.started is not None and "first_response" not in self.phases
+
+    def stats(self) -> Dict[str, float]:
+        return {f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in self.phases.items()}
+
+
+startup_timer = StartupTimer()
+
+
+def current_route() -> str:
+    """
+    Route template of the request being served, for tagging queries and logs
+    """
+    scope = REQUEST_SCOPE.get()
+    if scope is None:
+        return BACKGROUND_ROUTE
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", UNMATCHED_ROUTE)
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware) so streaming responses pass
+    straight through; latency is measured until the response body completes
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = REQUEST_SCOPE.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_SCOPE.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.labels(method, route_path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route_path, str(status_code)).inc()
+            if startup_timer.awaiting_first_response and status_code < 400 and route_path not in PROBE_ROUTES:
+                startup_timer.mark("first_response")
+
+
+def record_webhook_outcome(mode: str, outcome: str, count: int = 1):
+    WEBHOOK_EVENTS.labels(mode, outcome).inc(count)
+    if outcome in WRITTEN_OUTCOMES:
+        _write_totals["written"] += count
+    elif outcome in SAVED_OUTCOMES:
+        _write_totals["saved"] += count
+    else:
+        return
+    WEBHOOK_WRITES_SAVED_RATIO.set(_saved_ratio())
+
+
+def record_webhook_results(mode: str, results):
+    """
+    Counts per-item outcomes from upsert_payloads (created/updated/unchanged/merged/error)
+    """
+    counts = {}
+    for result in results:
+        counts[result.get("status")] = counts.get(result.get("status"), 0) + 1
+    for outcome, count in counts.items():
+        record_webhook_outcome(mode, outcome, count)
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
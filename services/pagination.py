@@ -0,0 +1,109 @@
+"""
+Opaque keyset-pagination cursors
+
+A cursor is the sort key of the last row on a page, JSON-encoded and then
+base64url-encoded so clients treat it as an opaque token.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+
+from fastapi import HTTPException, Query
+from sqlalchemy import tuple_
+from sqlalchemy.future import select
+
+from models.shipment import Shipment
+
+
+def encode_cursor(*values: Any) -> str:
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """
+    Returns the decoded sort key, or raises 400 for a malformed cursor.
+
+    Every cursor ends with the row id (int); the sort columns before it are
+    timestamps, encoded as ISO strings or null.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    *sort_key, row_id = values
+    # bool הוא int בפייתון - true לא מזהה שורה
+    if not isinstance(row_id, int) or isinstance(row_id, bool):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    for value in sort_key:
+        if value is not None and not isinstance(value, str):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        parse_cursor_datetime(value)
+    return values
+
+
+def keyset_cursor(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+) -> Optional[List[Any]]:
+    """
+    Dependency for (timestamp, id) cursors. Declare it before the database
+    dependency, so a malformed cursor is a 400 without checking out a session
+    """
+    return decode_cursor(cursor, 2)
+
+
+def parse_cursor_datetime(value: Any) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def fetch_updated_desc_page(db, columns, filters, after: Optional[List[Any]], limit: int):
+    """
+    One page of shipments ordered by (updated_at DESC NULLS LAST, id DESC).
+
+    `columns` must include Shipment.updated_at and Shipment.id. The non-NULL
+    part is read with a row comparison so it stays a range scan on the
+    (…, updated_at DESC NULLS LAST, id DESC) indexes; rows without updated_at
+    are read afterwards by id. Returns (rows, next_cursor).
+    """
+    query = (
+        select(*columns)
+        .where(*filters)
+        .order_by(Shipment.updated_at.desc().nulls_last(), Shipment.id.desc())
+        .limit(limit + 1)
+    )
+    after_updated_at = parse_cursor_datetime(after[0]) if after else None
+
+    if after is None or after_updated_at is None:
+        if after is not None:
+            # הסמן כבר בתוך השורות ללא updated_at (NULLS LAST)
+            query = query.where(Shipment.updated_at.is_(None), Shipment.id < after[1])
+        rows = (await db.execute(query)).all()
+    else:
+        rows = (await db.execute(query.where(
+            tuple_(Shipment.updated_at, Shipment.id) < tuple_(after_updated_at, after[1])
+        ))).all()
+        if len(rows) <= limit:
+            rows += (await db.execute(
+                select(*columns)
+                .where(*filters, Shipment.updated_at.is_(None))
+                .order_by(Shipment.id.desc())
+                .limit(limit + 1 - len(rows))
+            )).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+    return rows, next_cursor
@@ -0,0 +1,127 @@
+"""
+Projected row serialization shared by the API endpoints
+
+A FieldSpec is the single definition of a response shape: the columns to
+select (as row tuples, no ORM hydration) and the keys they map to. Rows are
+turned into dicts with one zip and encoded with orjson, which writes
+datetimes as ISO-8601 itself - the same text .isoformat() produced.
+"""
+import csv
+import io
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from models.shipment import Shipment
+from models.shipment_event import ShipmentEvent
+
+
+def encode_json(content: Any) -> bytes:
+    return orjson.dumps(content)
+
+
+# fastapi.responses.ORJSONResponse is deprecated and warns on every instance
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+class FieldSpec:
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.fields = [column.key for column in self.columns]
+        self._datetime_indexes = [
+            i for i, column in enumerate(self.columns) if column.type.python_type is datetime
+        ]
+
+    def query_columns(self, *extra) -> List[Any]:
+        """
+        The spec's columns plus any extra ones the query needs (cursor keys);
+        extras go last so row() ignores them
+        """
+        keys = set(self.fields)
+        return self.columns + [column for column in extra if column.key not in keys]
+
+    def row(self, row) -> Dict[str, Any]:
+        return dict(zip(self.fields, row))
+
+    def rows(self, rows: Iterable) -> List[Dict[str, Any]]:
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+    def ndjson(self, rows: Iterable) -> bytes:
+        fields = self.fields
+        return b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+    def csv_header(self) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(self.fields)
+        return buffer.getvalue().encode("utf-8")
+
+    def csv(self, rows: Iterable) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = len(self.fields)
+        for row in rows:
+            values = list(row[:count])
+            for i in self._datetime_indexes:
+                if values[i] is not None:
+                    values[i] = values[i].isoformat()
+            writer.writerow(values)
+        return buffer.getvalue().encode("utf-8")
+
+
+# צורות התשובה של ה-API - הגדרה אחת לכל צורה
+CUSTOMER_SHIPMENT_SPEC = FieldSpec([
+    Shipment.track_no,
+    Shipment.invoice_number,
+    Shipment.status_code,
+    Shipment.status_desc,
+    Shipment.exception_code,
+    Shipment.exception_desc,
+    Shipment.estimated_delivery,
+    Shipment.delivered_time,
+    Shipment.received_by,
+    Shipment.current_location,
+    Shipment.last_scan_location,
+    Shipment.delivery_attempt_count,
+    Shipment.created_at,
+    Shipment.updated_at,
+])
+
+# /shipments/track/{track_no} ו-/export
+TRACKING_SPEC = FieldSpec([
+    Shipment.track_no,
+    Shipment.customer_id,
+    Shipment.invoice_number,
+    Shipment.status_code,
+    Shipment.status_desc,
+    Shipment.exception_code,
+    Shipment.exception_desc,
+    Shipment.estimated_delivery,
+    Shipment.delivered_time,
+    Shipment.received_by,
+    Shipment.service_code,
+    Shipment.current_location,
+    Shipment.last_scan_location,
+    Shipment.delivery_attempt_count,
+    Shipment.created_at,
+    Shipment.updated_at,
+])
+
+EVENT_SPEC = FieldSpec([
+    ShipmentEvent.received_at,
+    ShipmentEvent.status_code,
+    ShipmentEvent.status_desc,
+    ShipmentEvent.exception_code,
+    ShipmentEvent.exception_desc,
+    ShipmentEvent.estimated_delivery,
+    ShipmentEvent.delivered_time,
+    ShipmentEvent.received_by,
+    ShipmentEvent.current_location,
+    ShipmentEvent.last_scan_location,
+    ShipmentEvent.last_scan_time,
+    ShipmentEvent.delivery_attempt_count,
+])
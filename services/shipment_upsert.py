@@ -0,0 +1,247 @@
+"""
+Set-based upsert of UPS webhook payloads into the shipments table
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, insert, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.shipment import Shipment
+from models.shipment_event import ShipmentEvent
+from services import change_events
+from services.webhook_payload import (
+    PAYLOAD_COLUMNS,
+    STATUS_FIELDS,
+    WebhookPayload,
+    error_summary,
+)
+
+logger = logging.getLogger(__name__)
+
+# asyncpg caps a statement at 32767 bind parameters, so large batches are
+# written as several multi-row statements inside the same transaction
+ROWS_PER_STATEMENT = 1000
+
+# כל העמודות ש-ON CONFLICT מעדכן
+UPDATE_COLUMNS = STATUS_FIELDS + ["status_hash", "updated_at"]
+
+# סדר העמודות בשורה שמחזירה payload_to_row
+ROW_COLUMNS = PAYLOAD_COLUMNS + ["status_hash", "created_at", "updated_at"]
+
+# עמודות הסטטוס שנשמרות בהיסטוריית shipment_events
+EVENT_FIELDS = [
+    "track_no",
+    "status_code",
+    "status_desc",
+    "exception_code",
+    "exception_desc",
+    "estimated_delivery",
+    "delivered_time",
+    "received_by",
+    "current_location",
+    "last_scan_location",
+    "last_scan_time",
+    "delivery_attempt_count",
+]
+
+
+class PayloadError(ValueError):
+    """Raised when a webhook payload cannot be mapped to a shipment row"""
+
+
+def decode_payload(data: Any) -> WebhookPayload:
+    """
+    Validates a decoded JSON value (batch items, NDJSON lines); raises PayloadError
+    """
+    if isinstance(data, WebhookPayload):
+        return data
+    if not isinstance(data, dict):
+        raise PayloadError("payload must be a JSON object")
+    try:
+        return WebhookPayload.model_validate(data)
+    except ValidationError as e:
+        raise PayloadError(error_summary(e))
+
+
+def payload_to_row(data: Any, now: datetime) -> Dict[str, Any]:
+    """
+    המרת payload של webhook לשורה בטבלת shipments
+    """
+    return decode_payload(data).to_row(now)
+
+
+def _build_upsert():
+    """
+    INSERT ... ON CONFLICT (track_no) DO UPDATE, built once so SQLAlchemy
+    caches its compiled form. Insert-only columns are left untouched when the
+    shipment already exists. The update only happens when status_hash
+    changed, so a re-delivered status writes nothing (no new row version,
+    no index churn) and returns no row. RETURNING reports whether each row
+    was inserted (xmax = 0) or updated.
+    """
+    stmt = pg_insert(Shipment)
+    return stmt.on_conflict_do_update(
+        index_elements=[Shipment.track_no],
+        set_={column: stmt.excluded[column] for column in UPDATE_COLUMNS},
+        where=Shipment.status_hash.is_distinct_from(stmt.excluded.status_hash),
+    ).returning(Shipment.track_no, literal_column("(xmax = 0)").label("inserted"))
+
+
+UPSERT_STATEMENT = _build_upsert()
+
+EVENT_INSERT_STATEMENT = insert(ShipmentEvent)
+
+
+def _build_write(with_notify: bool):
+    """
+    One webhook event in one statement: the upsert, its shipment_events row
+    and the NOTIFY to other workers as data-modifying CTEs. The history row
+    and the NOTIFY hang off the upsert's RETURNING, so an unchanged status
+    writes neither. Returns (track_no, inserted), or no row when unchanged.
+    """
+    upsert = pg_insert(Shipment).values({column: bindparam(column) for column in ROW_COLUMNS})
+    written = upsert.on_conflict_do_update(
+        index_elements=[Shipment.track_no],
+        set_={column: upsert.excluded[column] for column in UPDATE_COLUMNS},
+        where=Shipment.status_hash.is_distinct_from(upsert.excluded.status_hash),
+    ).returning(
+        Shipment.track_no,
+        literal_column("(xmax = 0)").label("inserted"),
+        # אחרי העדכון השורה מחזיקה את ערכי הסטטוס של האירוע
+        *(Shipment.__table__.c[column] for column in EVENT_FIELDS if column != "track_no"),
+        Shipment.updated_at,
+    ).cte("written")
+    history = insert(ShipmentEvent).from_select(
+        [*EVENT_FIELDS, "received_at"],
+        select(*(written.c[column] for column in EVENT_FIELDS), written.c.updated_at),
+    ).cte("history")
+    columns = [written.c.track_no, written.c.inserted]
+    if with_notify:
+        columns.append(func.pg_notify(bindparam("channel"), bindparam("payload")).label("notified"))
+    return select(*columns).add_cte(history)
+
+
+WRITE_STATEMENT = _build_write(with_notify=False)
+WRITE_AND_NOTIFY_STATEMENT = _build_write(with_notify=True)
+
+
+async def write_row(db: AsyncSession, row: Dict[str, Any]):
+    """
+    Writes one webhook row - upsert, history and NOTIFY in a single round
+    trip. Returns (track_no, inserted), or None when the status is unchanged.
+    The caller commits and then calls change_events.publish() for its own
+    process.
+    """
+    if not change_events.NOTIFY_ENABLED:
+        return (await db.execute(WRITE_STATEMENT, row)).one_or_none()
+    (payload,) = change_events.encode_payloads([row["track_no"]])
+    params = {**row, "channel": change_events.CHANNEL, "payload": payload}
+    return (await db.execute(WRITE_AND_NOTIFY_STATEMENT, params)).one_or_none()
+
+
+def event_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    event = {column: row[column] for column in EVENT_FIELDS}
+    event["received_at"] = row["updated_at"]
+    return event
+
+
+def merge_payloads(
+    payloads: List[Optional[WebhookPayload]],
+) -> Tuple[Dict[str, WebhookPayload], Dict[int, str]]:
+    """
+    איחוד כפילויות של אותו מספר מעקב בתוך batch (last write wins).
+
+    The last payload of each track_no replaces the whole row, exactly like
+    sending the events one at a time through /webhook: a field missing from
+    the later payload is written as its default, not kept from an earlier
+    one (bulk_load's DISTINCT ON ... seq DESC applies the same rule).
+    Returns that payload per track_no and the index of the item that reports
+    the write outcome. Invalid items (None) are skipped.
+    """
+    last: Dict[str, WebhookPayload] = {}
+    last_index: Dict[str, int] = {}
+    for index, payload in enumerate(payloads):
+        if payload is None:
+            continue
+        last[payload.track_no] = payload
+        last_index[payload.track_no] = index
+    return last, {index: track_no for track_no, index in last_index.items()}
+
+
+async def upsert_payloads(db: AsyncSession, payloads: List[Any]) -> List[Dict[str, Any]]:
+    """
+    כתיבת batch של payloads (WebhookPayload או JSON מפוענח) בטרנזקציה אחת.
+
+    Returns one result per input item, in input order. The caller commits.
+    """
+    now = datetime.utcnow()
+    results: List[Dict[str, Any]] = [{"index": i} for i in range(len(payloads))]
+
+    decoded: List[Optional[WebhookPayload]] = []
+    for index, data in enumerate(payloads):
+        try:
+            payload = decode_payload(data)
+        except PayloadError as e:
+            if isinstance(data, dict) and data.get("trackNo"):
+                results[index]["track_no"] = data["trackNo"]
+            results[index].update(status="error", error=str(e))
+            decoded.append(None)
+            continue
+        results[index]["track_no"] = payload.track_no
+        decoded.append(payload)
+
+    merged, reporters = merge_payloads(decoded)
+    rows = []
+    events = []
+    for index, payload in enumerate(decoded):
+        if payload is None:
+            continue
+        # כל אירוע נרשם בהיסטוריה, גם אם אוחד עם אירוע מאוחר יותר
+        events.append(event_row(payload.to_row(now)))
+        if index in reporters:
+            rows.append(merged[payload.track_no].to_row(now))
+        else:
+            results[index]["status"] = "merged"
+
+    outcomes: Dict[str, str] = {}
+    for start in range(0, len(rows), ROWS_PER_STATEMENT):
+        # executemany + RETURNING is sent as one multi-row INSERT (insertmanyvalues)
+        result = await db.execute(UPSERT_STATEMENT, rows[start:start + ROWS_PER_STATEMENT])
+        for track_no, inserted in result.all():
+            outcomes[track_no] = "created" if inserted else "updated"
+
+    # משלוח שהסטטוס שלו לא השתנה לא מקבל גם שורת היסטוריה
+    events = [event for event in events if event["track_no"] in outcomes]
+    if events:
+        await db.execute(EVENT_INSERT_STATEMENT, events)
+
+    for index in reporters:
+        results[index]["status"] = outcomes.get(results[index]["track_no"], "unchanged")
+
+    # כפילויות מקבלות את התוצאה של הפריט שנכתב בפועל
+    for result in results:
+        if result.get("status") == "merged":
+            result["outcome"] = outcomes.get(result["track_no"], "unchanged")
+
+    logger.info(f"Upserted {len(outcomes)} of {len(rows)} shipments from {len(payloads)} webhook items")
+    return results
+
+
+def parse_batch_body(body: bytes) -> List[Any]:
+    """
+    פענוח גוף הבקשה: מערך JSON או NDJSON (אובייקט אחד בכל שורה)
+    """
+    text = body.decode("utf-8").strip()
+    if not text:
+        return []
+    if text.startswith("["):
+        items = orjson.loads(text)
+        if not isinstance(items, list):
+            raise ValueError("expected a JSON array")
+        return items
+    return [orjson.loads(line) for line in text.splitlines() if line.strip()]
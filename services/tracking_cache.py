@@ -0,0 +1,219 @@
+"""
+Read-through LRU + TTL cache for /api/v1/shipments/track/{track_no}
+
+Entries hold the serialized JSON response with its validators (or None for
+a 404), keyed by track_no. Concurrent misses for the same key share one load (single-flight)
+and webhook writes invalidate through services.change_events.
+
+A track_no invalidated by a write is refilled from the primary (the loader
+gets primary=True): a lagging replica could still return the old row, which
+would then be served for the whole TTL.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+from services import change_events
+
+CACHE_MAX_ENTRIES = int(os.getenv("TRACKING_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("TRACKING_CACHE_TTL_SECONDS", "300"))
+NEGATIVE_TTL_SECONDS = float(os.getenv("TRACKING_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+
+
+class TrackingCache:
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._invalidated_inflight: Set[str] = set()
+        # נכתבו ועוד לא נטענו מחדש - הטעינה הבאה מה-primary
+        self._written: "OrderedDict[str, None]" = OrderedDict()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.shared_loads = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.primary_fills = 0
+
+    def peek(self, track_no: str) -> Tuple[bool, Any]:
+        """
+        Returns (found, value) without loading. value is None for a cached 404.
+        """
+        entry = self._entries.get(track_no)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[track_no]
+            return False, None
+        self._entries.move_to_end(track_no)
+        if value is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, value
+
+    def fill_from_primary(self, track_no: str) -> bool:
+        """
+        True while track_no was written and not loaded again since
+        """
+        return track_no in self._written
+
+    def _filled(self, track_no: str):
+        # טעינה שהתחילה לפני כתיבה נוספת לא מנקה את הסימון
+        if track_no in self._invalidated_inflight:
+            self._invalidated_inflight.discard(track_no)
+            return False
+        self._written.pop(track_no, None)
+        return True
+
+    async def get(
+        self, track_no: str, loader: Callable[[str, bool], Awaitable[Any]]
+    ) -> Any:
+        found, value = self.peek(track_no)
+        if found:
+            return value
+
+        inflight = self._inflight.get(track_no)
+        if inflight is not None:
+            # single-flight: מחכים לשאילתה שכבר רצה לאותו מספר מעקב
+            self.shared_loads += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        primary = self.fill_from_primary(track_no)
+        self.primary_fills += primary
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[track_no] = future
+        try:
+            value = await loader(track_no, primary)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[track_no]
+            if future.done():
+                # הטעינה נכשלה או בוטלה - הסימון לא יישאר לטעינה הבאה
+                self._invalidated_inflight.discard(track_no)
+
+        # a write that committed while we were loading makes this value stale
+        if self._filled(track_no):
+            self.put(track_no, value)
+        future.set_result(value)
+        return value
+
+    async def get_many(
+        self, track_nos: List[str], loader: Callable[[List[str], bool], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Batch read-through: cached keys are served as-is and all misses go to
+        one loader call (on the primary when any of them was written). Keys
+        the loader does not return are cached as None.
+        """
+        values: Dict[str, Any] = {}
+        shared: Dict[str, asyncio.Future] = {}
+        missing: List[str] = []
+        for track_no in track_nos:
+            found, value = self.peek(track_no)
+            if found:
+                values[track_no] = value
+            elif track_no in self._inflight:
+                self.shared_loads += 1
+                shared[track_no] = self._inflight[track_no]
+            else:
+                missing.append(track_no)
+
+        if missing:
+            self.misses += len(missing)
+            primary = any(self.fill_from_primary(track_no) for track_no in missing)
+            self.primary_fills += primary
+            loop = asyncio.get_running_loop()
+            futures = {track_no: loop.create_future() for track_no in missing}
+            self._inflight.update(futures)
+            try:
+                loaded = await loader(missing, primary)
+            except asyncio.CancelledError:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in futures.values():
+                    future.set_exception(e)
+                    future.exception()
+                raise
+            finally:
+                for track_no in missing:
+                    del self._inflight[track_no]
+                    if futures[track_no].done():
+                        self._invalidated_inflight.discard(track_no)
+
+            for track_no, future in futures.items():
+                value = loaded.get(track_no)
+                if self._filled(track_no):
+                    self.put(track_no, value)
+                future.set_result(value)
+                values[track_no] = value
+
+        for track_no, future in shared.items():
+            values[track_no] = await asyncio.shield(future)
+        return values
+
+    def put(self, track_no: str, value: Any):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._entries[track_no] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(track_no)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, track_nos: Iterable[str]):
+        for track_no in track_nos:
+            if self._entries.pop(track_no, None) is not None:
+                self.invalidations += 1
+            if track_no in self._inflight:
+                self._invalidated_inflight.add(track_no)
+            self._written[track_no] = None
+            self._written.move_to_end(track_no)
+        # הישנים ביותר נכתבו מזמן - הרפליקה כבר השיגה אותם
+        while len(self._written) > self.max_entries:
+            self._written.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        # loads already running may return what the missed writes replaced
+        self._invalidated_inflight.update(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses + self.shared_loads
+        served_from_cache = self.hits + self.negative_hits
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "negative_ttl_seconds": self.negative_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "shared_loads": self.shared_loads,
+            "hit_ratio": round(served_from_cache / lookups, 4) if lookups else None,
+            "miss_ratio": round(self.misses / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "primary_fills": self.primary_fills,
+            "pending_primary_fills": len(self._written),
+        }
+
+
+tracking_cache = TrackingCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, NEGATIVE_TTL_SECONDS)
+change_events.register(tracking_cache.invalidate)
+change_events.register_reset(tracking_cache.clear)
@@ -0,0 +1,134 @@
+"""
+Cold-start warmup
+
+Right after startup every pool opens pool_size connections in parallel and
+runs the registered primers on each one: the hot read queries are executed
+once with a key that matches nothing, so every pooled asyncpg connection
+already holds their prepared statements (and SQLAlchemy has compiled them)
+before the first real request. Non-database steps (Jinja templates) run
+first. /ready answers 503 until the warmup has finished.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from database.session import engine, read_engine
+from services.metrics import startup_timer
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+# מפתח שלא קיים - השאילתות רצות (prepare + plan) בלי להחזיר שורות
+WARMUP_KEY = "__warmup__"
+
+Primer = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class Warmup:
+    def __init__(self, engines: List[AsyncEngine]):
+        self.engines = engines
+        self._primers: List[Tuple[AsyncEngine, Primer]] = []
+        self._steps: List[Callable[[], Any]] = []
+        self._task: Optional[asyncio.Task] = None
+
+        self.ready = False
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self.connections = 0
+        self.primer_runs = 0
+        self.duration_ms: Optional[float] = None
+
+    def primer(self, target: AsyncEngine):
+        """
+        Registers an async fn(session) run on every pooled connection of target
+        """
+        def decorator(fn: Primer):
+            self._primers.append((target, fn))
+            return fn
+        return decorator
+
+    def step(self, fn: Callable[[], Any]):
+        """
+        Registers a synchronous startup step (template loading and such)
+        """
+        self._steps.append(fn)
+        return fn
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="warmup")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        for step in self._steps:
+            try:
+                step()
+            except Exception as e:
+                logger.error(f"Warmup step {step.__name__} failed: {e!r}")
+        # הדאטאבייס עוד לא זמין (deploy, נפילה) - מנסים שוב עד שמצליח
+        while True:
+            self.attempts += 1
+            started = time.perf_counter()
+            try:
+                await self.warm()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = repr(e)
+                logger.error(f"Warmup attempt {self.attempts} failed, retrying in {RETRY_SECONDS}s: {e!r}")
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            self.duration_ms = (time.perf_counter() - started) * 1000
+            self.ready = True
+            startup_timer.mark("warm")
+            return
+
+    async def warm(self):
+        counts = await asyncio.gather(*(self._warm_engine(e) for e in self.engines))
+        self.connections = sum(connections for connections, _ in counts)
+        self.primer_runs = sum(runs for _, runs in counts)
+
+    async def _warm_engine(self, target: AsyncEngine) -> Tuple[int, int]:
+        primers = [fn for primer_engine, fn in self._primers if primer_engine is target]
+        size = target.sync_engine.pool.size()
+        # כל החיבורים פתוחים יחד, כך שכל אחד מהם הוא חיבור נפרד ב-pool
+        opened = await asyncio.gather(*(target.connect().start() for _ in range(size)), return_exceptions=True)
+        connections = [conn for conn in opened if not isinstance(conn, BaseException)]
+        try:
+            errors = [conn for conn in opened if isinstance(conn, BaseException)]
+            if errors:
+                raise errors[0]
+            await asyncio.gather(*(self._prime(conn, primers) for conn in connections))
+        finally:
+            await asyncio.gather(*(conn.close() for conn in connections), return_exceptions=True)
+        return len(connections), len(connections) * len(primers)
+
+    async def _prime(self, conn, primers: List[Primer]):
+        async with AsyncSession(bind=conn) as session:
+            for primer in primers:
+                await primer(session)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "connections": self.connections,
+            "primers": len(self._primers),
+            "primer_runs": self.primer_runs,
+            "duration_ms": round(self.duration_ms, 1) if self.duration_ms is not None else None,
+            "startup": startup_timer.stats(),
+        }
+
+
+warmup = Warmup([engine, read_engine])
@@ -0,0 +1,138 @@
+"""
+Typed UPS webhook payload
+
+The single declaration of the payload -> shipments mapping: every field is
+named after its column and aliased to the UPS payload key. Payloads are
+decoded straight from the request bytes by pydantic-core's compiled
+validator (no intermediate dict), and bad payloads fail with field-level
+errors that the routes return as 422.
+"""
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+
+class WebhookPayload(BaseModel):
+    # UPS sends some references as numbers; unknown keys are ignored
+    model_config = ConfigDict(extra="ignore", coerce_numbers_to_str=True)
+
+    track_no: str = Field(alias="trackNo", min_length=1)
+    # INTEGER columns - ערך מחוץ לטווח נדחה כאן (422) ולא ב-asyncpg
+    status_code: int = Field(0, alias="statusCode", ge=-2**31, le=2**31 - 1)
+
+    # מתעדכנים בכל webhook
+    status_desc: Optional[str] = Field(None, alias="statusDescHeb")
+    exception_code: Optional[str] = Field(None, alias="exceptionCode")
+    exception_desc: Optional[str] = Field(None, alias="exceptionDescHeb")
+    estimated_delivery: Optional[str] = Field(None, alias="estimateDelivery")
+    delivered_time: Optional[str] = Field(None, alias="deliveredTime")
+    received_by: Optional[str] = Field(None, alias="receivedBy")
+    service_code: Optional[str] = Field(None, alias="serviceCode")
+    current_location: Optional[str] = Field(None, alias="currentLocation")
+    last_scan_location: Optional[str] = Field(None, alias="lastScanLocation")
+    delivery_instructions: Optional[str] = Field(None, alias="deliveryInstructions")
+
+    # נכתבים רק ביצירת משלוח
+    customer_id: Optional[str] = Field(None, alias="ref1")
+    invoice_number: Optional[str] = Field(None, alias="ref2")
+    package_weight: Optional[float] = Field(None, alias="packageWeight")
+    package_dimensions: Optional[str] = Field(None, alias="packageDimensions")
+    shipper_name: Optional[str] = Field(None, alias="shipperName")
+    shipper_address: Optional[str] = Field(None, alias="shipperAddress")
+    recipient_name: Optional[str] = Field(None, alias="recipientName")
+    recipient_address: Optional[str] = Field(None, alias="recipientAddress")
+    ref1: Optional[str] = Field(None, alias="ref1")
+    ref2: Optional[str] = Field(None, alias="ref2")
+    ref3: Optional[str] = Field(None, alias="ref3")
+    shipping_cost: Optional[float] = Field(None, alias="shippingCost")
+    insurance_value: Optional[float] = Field(None, alias="insuranceValue")
+
+    last_scan_time: Optional[datetime] = Field(None, alias="lastScanTime")
+    delivery_attempt_count: Optional[int] = Field(0, alias="deliveryAttemptCount", ge=0, le=2**31 - 1)
+    signature_required: Optional[bool] = Field(False, alias="signatureRequired")
+
+    @field_validator("last_scan_time", mode="before")
+    @classmethod
+    def _empty_scan_time(cls, value: Any) -> Any:
+        return None if value == "" else value
+
+    @field_validator("last_scan_time")
+    @classmethod
+    def _naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # timestamps are stored as naive UTC
+        if value is not None and value.tzinfo is not None:
+            return value.replace(tzinfo=None) - value.utcoffset()
+        return value
+
+    def status_hash(self) -> str:
+        """
+        Fingerprint of the fields an update writes; an identical re-delivery
+        has the same hash and is not written again
+        """
+        values = self.__dict__
+        encoded = orjson.dumps([values[field] for field in STATUS_FIELDS])
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    def to_row(self, now: datetime) -> Dict[str, Any]:
+        # __dict__ holds exactly the fields, in declaration (PAYLOAD_COLUMNS) order
+        row = dict(self.__dict__)
+        row["status_hash"] = self.status_hash()
+        row["created_at"] = now
+        row["updated_at"] = now
+        return row
+
+
+# עמודות שמתעדכנות בכל webhook / רק ביצירה - לפי סדר ההגדרה במודל
+UPDATE_FIELDS = [
+    "status_desc", "exception_code", "exception_desc", "estimated_delivery", "delivered_time",
+    "received_by", "service_code", "current_location", "last_scan_location", "delivery_instructions",
+]
+INSERT_ONLY_FIELDS = [
+    "customer_id", "invoice_number", "package_weight", "package_dimensions", "shipper_name",
+    "shipper_address", "recipient_name", "recipient_address", "ref1", "ref2", "ref3",
+    "shipping_cost", "insurance_value",
+]
+# השדות ש-ON CONFLICT מעדכן, ועליהם מחושב status_hash
+STATUS_FIELDS = UPDATE_FIELDS + [
+    "status_code", "last_scan_time", "delivery_attempt_count", "signature_required",
+]
+# סדר העמודות בשורה של to_row (בלי status_hash/created_at/updated_at)
+PAYLOAD_COLUMNS = list(WebhookPayload.model_fields)
+
+
+def error_summary(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'payload'}: {e['msg']}" for e in error.errors()
+    )
+
+
+# ב-422 מוחזר רק קטע מהקלט, לא גוף הבקשה כולו
+ERROR_INPUT_PREVIEW_CHARS = 80
+
+
+def _input_preview(value: Any) -> str:
+    preview = repr(value)
+    if len(preview) > ERROR_INPUT_PREVIEW_CHARS:
+        preview = preview[:ERROR_INPUT_PREVIEW_CHARS] + "..."
+    return preview
+
+
+def decode_webhook(body: bytes) -> WebhookPayload:
+    """
+    Decodes one payload from raw request bytes; raises RequestValidationError (422).
+
+    The offending input is reported as a short repr string: for invalid JSON
+    it is the raw body, which may be any bytes and should not be echoed back
+    in full.
+    """
+    try:
+        return WebhookPayload.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError([
+            {**err, "loc": ("body", *err["loc"]), "input": _input_preview(err.get("input"))}
+            for err in e.errors(include_url=False)
+        ])
@@ -0,0 +1,12 @@
+"""
+Unit tests run without a database. The URL is set before anything imports
+database.session, so load_dotenv() never picks up the .env credentials;
+the engines are created lazily and never connect.
+"""
+import os
+import sys
+
+os.environ["DATABASE_URL"] = "postgresql+asyncpg://postgres@localhost/postgres"
+os.environ.pop("DATABASE_READ_URL", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
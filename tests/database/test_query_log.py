@@ -0,0 +1,25 @@
+import pytest
+
+from database.query_log import explainable
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT shipments.track_no FROM shipments WHERE shipments.track_no = $1",
+    "  select max(updated_at), count(*) from shipments where customer_id = $1",
+    "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'shipments')",
+])
+def test_table_reads_are_explained(statement):
+    assert explainable(statement)
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT pg_advisory_lock(hashtext($1))",
+    "SELECT pg_notify($1, $2)",
+    "SELECT 1",
+    "SELECT pg_advisory_xact_lock(id) FROM shipments WHERE track_no = $1",
+    "SELECT nextval('shipments_id_seq') FROM generate_series(1, 10)",
+    "INSERT INTO shipments (track_no) VALUES ($1)",
+    "UPDATE shipments SET status_code = $1 FROM shipment_statuses",
+])
+def test_side_effects_are_never_re_run(statement):
+    assert not explainable(statement)
@@ -0,0 +1,80 @@
+"""
+Conditional GET on the customer list. Needs a scratch database (the test
+truncates shipments):
+
+    TEST_DATABASE_URL=postgresql+asyncpg://postgres@localhost/test python -m pytest tests/routes/test_api.py
+"""
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.requests import Request
+
+from database.migrations import migrate
+from routes.api import get_customer_shipments
+from services.conditional import http_date
+from services.shipment_upsert import upsert_payloads
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set (the test truncates shipments)"
+)
+
+CUSTOMER = "CUSTTEST"
+
+
+def request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+async def set_status(db, track_no: str, status_code: int, updated_at: datetime):
+    await db.execute(
+        text("UPDATE shipments SET status_code = :code, updated_at = :at WHERE track_no = :track_no"),
+        {"code": status_code, "at": updated_at, "track_no": track_no},
+    )
+    await db.commit()
+
+
+async def in_transit_list(db, **headers):
+    return await get_customer_shipments(
+        CUSTOMER, request(**headers), after=None, db=db, status=None, status_code=[10], limit=50
+    )
+
+
+async def filter_exit_responses():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    try:
+        await migrate(engine)
+        async with AsyncSession(engine) as db:
+            await db.execute(text("TRUNCATE shipments, shipment_events"))
+            await upsert_payloads(db, [
+                {"trackNo": "1ZTEST0001", "ref1": CUSTOMER, "statusCode": 10},
+                {"trackNo": "1ZTEST0002", "ref1": CUSTOMER, "statusCode": 10},
+            ])
+            await db.commit()
+            await set_status(db, "1ZTEST0001", 10, datetime(2024, 5, 1, 10, 0, 0))
+            await set_status(db, "1ZTEST0002", 10, datetime(2024, 5, 1, 11, 0, 0))
+            first = await in_transit_list(db)
+
+            # the newest in-transit shipment is delivered: it leaves the filter
+            await set_status(db, "1ZTEST0002", 20, datetime(2024, 5, 1, 12, 0, 0))
+            after_exit = await in_transit_list(db, if_modified_since=first.headers["last-modified"])
+            by_etag = await in_transit_list(db, if_none_match=first.headers["etag"])
+            return first, after_exit, by_etag
+    finally:
+        await engine.dispose()
+
+
+def test_shipment_leaving_the_filter_changes_the_list_validators():
+    first, after_exit, by_etag = asyncio.run(filter_exit_responses())
+
+    assert first.status_code == 200
+    assert after_exit.status_code == 200
+    assert after_exit.headers["last-modified"] == http_date(datetime(2024, 5, 1, 12, 0, 0))
+    assert by_etag.status_code == 200
+    assert by_etag.headers["etag"] != first.headers["etag"]
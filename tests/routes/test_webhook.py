@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+from main import app
+
+# בלי with: ה-lifespan לא רץ, והבקשות האלו נדחות לפני שנוגעים בדאטאבייס
+client = TestClient(app)
+
+
+def test_non_utf8_body_is_422():
+    response = client.post("/webhook", content=b"\xff", headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 422
+    error = response.json()["detail"][0]
+    assert error["loc"] == ["body"]
+    assert error["input"] == repr(b"\xff")
+
+
+def test_invalid_json_body_is_422_without_echoing_the_body():
+    body = b'{"trackNo": "1ZA", ' + b'"x" ' * 1000
+
+    response = client.post("/webhook", content=body, headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 422
+    error = response.json()["detail"][0]
+    assert error["type"] == "json_invalid"
+    assert len(error["input"]) <= 100
+    assert len(response.content) < 1000
+
+
+def test_invalid_field_is_422_with_its_location():
+    response = client.post("/webhook", json={"trackNo": "1ZA", "statusCode": 2 ** 31})
+
+    assert response.status_code == 422
+    error = response.json()["detail"][0]
+    assert error["loc"] == ["body", "statusCode"]
+    assert error["input"] == repr(2 ** 31)
@@ -0,0 +1,42 @@
+from services import change_events
+from services.change_events import MAX_PAYLOAD_BYTES, WORKER_ID, decode_payload, encode_payloads
+
+
+def test_small_change_is_one_payload():
+    payloads = encode_payloads(["1ZA", "1ZB"])
+
+    assert len(payloads) == 1
+    assert decode_payload(payloads[0]) == (WORKER_ID, ["1ZA", "1ZB"])
+
+
+def test_large_change_is_chunked_under_the_notify_limit():
+    track_nos = [f"1Z{i:016d}" for i in range(2000)]
+
+    payloads = encode_payloads(track_nos)
+
+    assert len(payloads) > 1
+    assert all(len(payload.encode("utf-8")) <= MAX_PAYLOAD_BYTES for payload in payloads)
+    decoded = [decode_payload(payload) for payload in payloads]
+    assert {worker for worker, _ in decoded} == {WORKER_ID}
+    assert [t for _, chunk in decoded for t in chunk] == track_nos
+
+
+def test_no_track_nos_no_payload():
+    assert encode_payloads([]) == []
+
+
+def test_publish_deduplicates_and_isolates_listener_errors():
+    received = []
+
+    def failing(track_nos):
+        raise RuntimeError("listener bug")
+
+    change_events.register(failing)
+    change_events.register(received.append)
+    try:
+        change_events.publish(["1ZA", "", "1ZB", "1ZA"])
+    finally:
+        change_events._listeners.remove(failing)
+        change_events._listeners.remove(received.append)
+
+    assert received == [["1ZA", "1ZB"]]
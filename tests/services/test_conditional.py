@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from starlette.requests import Request
+
+from services.conditional import http_date, is_not_modified, make_etag
+
+LAST_MODIFIED = datetime(2024, 5, 1, 12, 30, 15, 250000)
+ETAG = make_etag("1ZA", LAST_MODIFIED)
+
+
+def request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_etag_is_weak_and_stable():
+    assert ETAG.startswith('W/"')
+    assert make_etag("1ZA", LAST_MODIFIED) == ETAG
+    assert make_etag("1ZB", LAST_MODIFIED) != ETAG
+
+
+def test_no_validators_is_modified():
+    assert not is_not_modified(request(), ETAG, LAST_MODIFIED)
+
+
+def test_if_none_match_weak_comparison():
+    strong = ETAG.removeprefix("W/")
+    assert is_not_modified(request(if_none_match=ETAG), ETAG, LAST_MODIFIED)
+    assert is_not_modified(request(if_none_match=strong), ETAG, LAST_MODIFIED)
+    assert is_not_modified(request(if_none_match=f'"other", {ETAG}'), ETAG, LAST_MODIFIED)
+    assert is_not_modified(request(if_none_match="*"), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(request(if_none_match='"other"'), ETAG, LAST_MODIFIED)
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    stale = request(if_none_match='"other"', if_modified_since=http_date(LAST_MODIFIED))
+    assert not is_not_modified(stale, ETAG, LAST_MODIFIED)
+
+
+def test_if_modified_since_at_second_precision():
+    # Last-Modified נשלח בלי מיקרו-שניות
+    assert is_not_modified(request(if_modified_since=http_date(LAST_MODIFIED)), ETAG, LAST_MODIFIED)
+    earlier = http_date(datetime(2024, 5, 1, 12, 30, 14))
+    assert not is_not_modified(request(if_modified_since=earlier), ETAG, LAST_MODIFIED)
+
+
+def test_bad_if_modified_since_is_ignored():
+    assert not is_not_modified(request(if_modified_since="yesterday"), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(request(if_modified_since=http_date(LAST_MODIFIED)), ETAG, None)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from services import ingest_queue as module
+from services.ingest_queue import IngestQueue
+from services.webhook_payload import WebhookPayload
+
+
+class FlakyQueue(IngestQueue):
+    """Records flush calls; a batch containing a rejected track_no fails"""
+    def __init__(self, rejected):
+        super().__init__(100, 10, 0.01)
+        self.rejects = set(rejected)
+        self.calls = []
+
+    async def _flush(self, items):
+        track_nos = [payload.track_no for payload, _ in items]
+        self.calls.append(track_nos)
+        if self.rejects.intersection(track_nos):
+            raise RuntimeError("rejected")
+
+
+def items(*track_nos):
+    return [(WebhookPayload.model_validate({"trackNo": track_no}), None) for track_no in track_nos]
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(module, "MAX_FLUSH_ATTEMPTS", 2)
+    monkeypatch.setattr(module, "MAX_RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(module.db_health, "available", lambda: True)
+
+
+def test_failing_batch_falls_back_to_items_and_drops_only_the_bad_one():
+    queue = FlakyQueue(rejected=["1ZB"])
+
+    asyncio.run(queue._write_batch(items("1ZA", "1ZB", "1ZC")))
+
+    assert queue.calls == [["1ZA", "1ZB", "1ZC"]] * 2 + [["1ZA"], ["1ZB"], ["1ZC"]]
+    assert queue.failed_flushes == 2
+    assert queue.dropped_events == 1
+
+
+def test_failing_single_item_is_dropped_without_another_attempt():
+    queue = FlakyQueue(rejected=["1ZA"])
+
+    asyncio.run(queue._write_batch(items("1ZA")))
+
+    assert queue.calls == [["1ZA"]] * 2
+    assert queue.dropped_events == 1
+
+
+def test_successful_batch_is_written_once():
+    queue = FlakyQueue(rejected=[])
+
+    asyncio.run(queue._write_batch(items("1ZA", "1ZB")))
+
+    assert queue.calls == [["1ZA", "1ZB"]]
+    assert queue.dropped_events == 0
@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from services.pagination import decode_cursor, encode_cursor
+
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def test_cursor_round_trip():
+    updated_at = datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+    cursor = encode_cursor(updated_at, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [updated_at.isoformat(), 42]
+
+
+def test_cursor_with_null_sort_key():
+    assert decode_cursor(encode_cursor(None, 7), 2) == [None, 7]
+
+
+def test_missing_cursor_is_first_page():
+    assert decode_cursor(None, 2) is None
+    assert decode_cursor("", 2) is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 at all!",
+    raw_cursor({"updated_at": None, "id": 1}),
+    raw_cursor(["2024-01-01T00:00:00"]),
+    raw_cursor(["2024-01-01T00:00:00", "x"]),
+    raw_cursor(["2024-01-01T00:00:00", True]),
+    raw_cursor(["2024-01-01T00:00:00", 1.5]),
+    raw_cursor([5, 1]),
+    raw_cursor(["yesterday", 1]),
+])
+def test_malformed_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+    assert error.value.detail == "Invalid cursor"
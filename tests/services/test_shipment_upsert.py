@@ -0,0 +1,90 @@
+import asyncio
+import os
+from datetime import datetime
+
+import asyncpg
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database.migrations import migrate
+from database.session import asyncpg_dsn
+from services import change_events
+from services.shipment_upsert import merge_payloads, write_row
+from services.webhook_payload import WebhookPayload
+
+
+def payload(**values) -> WebhookPayload:
+    return WebhookPayload.model_validate(values)
+
+
+def test_merge_payloads_keeps_last_payload_per_track_no():
+    first = payload(trackNo="1ZA", statusCode=5, currentLocation="תל אביב", ref1="CUST1")
+    other = payload(trackNo="1ZB", statusCode=10)
+    last = payload(trackNo="1ZA", statusCode=20)
+
+    merged, reporters = merge_payloads([first, other, last])
+
+    assert merged == {"1ZA": last, "1ZB": other}
+    # שדה שחסר ב-payload האחרון לא נלקח מהקודם
+    assert merged["1ZA"].current_location is None
+    assert merged["1ZA"].customer_id is None
+    assert reporters == {1: "1ZB", 2: "1ZA"}
+
+
+def test_merge_payloads_skips_invalid_items():
+    valid = payload(trackNo="1ZA", statusCode=5)
+
+    merged, reporters = merge_payloads([None, valid, None])
+
+    assert merged == {"1ZA": valid}
+    assert reporters == {1: "1ZA"}
+
+
+def test_merge_payloads_empty_batch():
+    assert merge_payloads([]) == ({}, {})
+
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+async def write_three_events():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    listener = await asyncpg.connect(asyncpg_dsn(TEST_DATABASE_URL))
+    notified = []
+    await listener.add_listener(change_events.CHANNEL, lambda *args: notified.append(args[3]))
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    try:
+        await migrate(engine)
+        async with AsyncSession(engine) as db:
+            await db.execute(text("TRUNCATE shipments, shipment_events"))
+            await db.commit()
+            statements.clear()
+            results = []
+            for status_code in (5, 5, 10):
+                row = payload(trackNo="1ZTEST0001", statusCode=status_code).to_row(datetime.utcnow())
+                results.append(await write_row(db, row))
+                await db.commit()
+            writes = len(statements)
+            events = (await db.execute(text(
+                "SELECT status_code FROM shipment_events WHERE track_no = '1ZTEST0001' ORDER BY id"
+            ))).scalars().all()
+        await asyncio.sleep(0.1)
+        return results, writes, events, notified
+    finally:
+        await listener.close()
+        await engine.dispose()
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set (the test truncates shipments)")
+def test_write_row_is_one_statement_with_history_and_notify():
+    results, writes, events, notified = asyncio.run(write_three_events())
+
+    assert [None if r is None else tuple(r[:2]) for r in results] == [
+        ("1ZTEST0001", True), None, ("1ZTEST0001", False),
+    ]
+    # upsert, history and NOTIFY together: one statement per event
+    assert writes == 3
+    assert events == [5, 10]
+    assert [change_events.decode_payload(p)[1] for p in notified] == [["1ZTEST0001"], ["1ZTEST0001"]]
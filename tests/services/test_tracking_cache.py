@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from services.tracking_cache import TrackingCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Loader:
+    """
+    Counts calls; each load waits for `release` so tests can interleave
+    """
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, track_no, primary):
+        self.calls.append((track_no, primary))
+        await self.release.wait()
+        return {"track_no": track_no, "primary": primary}
+
+
+def test_concurrent_misses_share_one_load():
+    async def scenario():
+        cache = TrackingCache(10, 60, 60)
+        loader = Loader()
+        tasks = [asyncio.create_task(cache.get("1ZA", loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        results = await asyncio.gather(*tasks)
+        return cache, loader, results
+
+    cache, loader, results = run(scenario())
+    assert loader.calls == [("1ZA", False)]
+    assert all(result is results[0] for result in results)
+    assert cache.misses == 1 and cache.shared_loads == 4
+    assert cache.peek("1ZA") == (True, results[0])
+
+
+def test_invalidate_while_loading_does_not_cache_stale_value():
+    async def scenario():
+        cache = TrackingCache(10, 60, 60)
+        loader = Loader()
+        task = asyncio.create_task(cache.get("1ZA", loader))
+        await asyncio.sleep(0)
+        cache.invalidate(["1ZA"])
+        loader.release.set()
+        stale = await task
+        cached = cache.peek("1ZA")
+        fresh = await cache.get("1ZA", loader)
+        return cache, loader, stale, cached, fresh
+
+    cache, loader, stale, cached, fresh = run(scenario())
+    # the load that raced the write is returned but not cached
+    assert stale == {"track_no": "1ZA", "primary": False}
+    assert cached == (False, None)
+    # the next load goes to the primary and is cached
+    assert fresh == {"track_no": "1ZA", "primary": True}
+    assert cache.peek("1ZA") == (True, fresh)
+    assert not cache.fill_from_primary("1ZA")
+
+
+def test_failed_load_clears_the_invalidated_mark():
+    async def failing(track_no, primary):
+        await asyncio.sleep(0)
+        raise RuntimeError("database down")
+
+    async def loaded(track_no, primary):
+        return {"track_no": track_no}
+
+    async def scenario():
+        cache = TrackingCache(10, 60, 60)
+        task = asyncio.create_task(cache.get("1ZA", failing))
+        await asyncio.sleep(0)
+        cache.invalidate(["1ZA"])
+        with pytest.raises(RuntimeError):
+            await task
+        await cache.get("1ZA", loaded)
+        return cache
+
+    cache = run(scenario())
+    assert cache.peek("1ZA") == (True, {"track_no": "1ZA"})
+
+
+def test_get_many_loads_misses_in_one_call():
+    calls = []
+
+    async def loader(track_nos, primary):
+        calls.append((list(track_nos), primary))
+        return {track_no: {"track_no": track_no} for track_no in track_nos if track_no != "1ZC"}
+
+    async def scenario():
+        cache = TrackingCache(10, 60, 60)
+        cache.put("1ZA", {"track_no": "1ZA", "cached": True})
+        values = await cache.get_many(["1ZA", "1ZB", "1ZC"], loader)
+        return cache, values
+
+    cache, values = run(scenario())
+    assert calls == [(["1ZB", "1ZC"], False)]
+    assert values == {
+        "1ZA": {"track_no": "1ZA", "cached": True},
+        "1ZB": {"track_no": "1ZB"},
+        "1ZC": None,
+    }
+    # a missing key is cached as a 404
+    assert cache.peek("1ZC") == (True, None)
@@ -0,0 +1,80 @@
+"""
+bulk_load and the webhook batch upsert have to leave the same history.
+Needs a scratch database (the test truncates shipments and shipment_events):
+
+    TEST_DATABASE_URL=postgresql+asyncpg://postgres@localhost/test python -m pytest tests/test_bulk_load.py
+"""
+import asyncio
+import os
+
+import asyncpg
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import bulk_load
+from database.migrations import migrate
+from database.session import asyncpg_dsn
+from services.shipment_upsert import EVENT_FIELDS, upsert_payloads
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set (the test truncates shipments)"
+)
+
+EXISTING = [{"trackNo": "1ZTEST0001", "statusCode": 10, "statusDescHeb": "בדרך"}]
+PAYLOADS = [
+    # אותו סטטוס שכבר שמור - לא נרשם
+    {"trackNo": "1ZTEST0001", "statusCode": 10, "statusDescHeb": "בדרך"},
+    {"trackNo": "1ZTEST0002", "statusCode": 5, "currentLocation": "תל אביב"},
+    {"trackNo": "1ZTEST0003", "statusCode": 1},
+    # כפילויות באותו batch - כל אחת נרשמת בהיסטוריה
+    {"trackNo": "1ZTEST0002", "statusCode": 10, "currentLocation": "חיפה"},
+    {"trackNo": "1ZTEST0002", "statusCode": 20, "receivedBy": "חתימה"},
+]
+
+
+async def upsert(engine, payloads):
+    async with AsyncSession(engine) as db:
+        await upsert_payloads(db, payloads)
+        await db.commit()
+
+
+async def bulk(engine, payloads):
+    conn = await asyncpg.connect(asyncpg_dsn(TEST_DATABASE_URL))
+    try:
+        await bulk_load.load_rows(conn, bulk_load.payload_rows(payloads), with_events=True)
+    finally:
+        await conn.close()
+
+
+async def recorded_events(write):
+    engine = create_async_engine(TEST_DATABASE_URL)
+    try:
+        await migrate(engine)
+        async with engine.begin() as conn:
+            await conn.execute(text("TRUNCATE shipments, shipment_events"))
+        await upsert(engine, EXISTING)
+        await write(engine, PAYLOADS)
+        async with engine.connect() as conn:
+            result = await conn.execute(text(
+                f"SELECT {', '.join(EVENT_FIELDS)} FROM shipment_events ORDER BY id"
+            ))
+            return [tuple(row) for row in result]
+    finally:
+        await engine.dispose()
+
+
+def test_bulk_load_and_batch_upsert_record_the_same_events():
+    from_upsert = asyncio.run(recorded_events(upsert))
+    from_bulk = asyncio.run(recorded_events(bulk))
+
+    assert from_bulk == from_upsert
+    assert [(event[0], event[1]) for event in from_upsert] == [
+        ("1ZTEST0001", 10),
+        ("1ZTEST0002", 5),
+        ("1ZTEST0003", 1),
+        ("1ZTEST0002", 10),
+        ("1ZTEST0002", 20),
+    ]